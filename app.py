@@ -1,27 +1,390 @@
-from flask import Flask, jsonify, request, redirect, url_for
-from sqlalchemy import text, create_engine
-from sqlalchemy.orm import sessionmaker
-from database import engine
-from models import Link, Click, MonthlyStat
+from flask import Flask, Response, g, jsonify, request, redirect, url_for
+from sqlalchemy import exc, text
+from database import engine, replica_engine, Session, db_session, pool_metrics, replica_pool_metrics
+from models import Link
+from validation import ValidationPipeline, PendingClick
+from cache import LinkCache, CachedLink, VerdictCache, ResponseCache
+from ingest import ClickBuffer
+from spool import ClickSpool
+from fraud import ClickRateScorer, rate_rules
+from hotlinks import HeavyHitters
+from replica import ReplicaMonitor
+from shortcodes import RandomCodeAllocator, SequenceCodeAllocator
+from links import get_or_create_links
+from stats import stats_page, seller_stats, top_links, most_clicked_links, encode_cursor, decode_cursor, export_link_stats
+import catalog
+import config
+import metrics
+import partitions
+import atexit
+import hashlib
+import json
+import logging
 import string
 import random
 import time
 from datetime import datetime, timezone
 
 app = Flask(__name__)
-
-# Create a session factory
-Session = sessionmaker(bind=engine)
+log = logging.getLogger(__name__)
+
+# Description of the API served at /
+API_INFO = {
+    "message": "Welcome to Fiverr URL Shortener API",
+    "endpoints": {
+        "POST /links": "Create a new short link",
+        "POST /links/batch": "Create many short links at once",
+        "GET /{short_code}": "Redirect to the original URL",
+        "GET /stats": "Get link statistics with pagination",
+        "GET /stats/export": "Stream statistics for every link as NDJSON",
+        "GET /stats/top": "Most clicked links right now, with their click rates",
+        "GET /sellers/{seller_id}/stats": "Get a seller's totals, monthly earnings and links",
+        "GET /hello": "Health check endpoint",
+        "GET /admin/validation": "Fraud validation backlog",
+        "GET /admin/cache": "Link cache counters",
+        "GET /admin/clicks": "Click buffer counters",
+        "GET /admin/pool": "Database connection pool metrics",
+        "GET /admin/replica": "Read replica health and read routing counters",
+        "GET /metrics": "Latency, query and component metrics in Prometheus text format"
+    },
+    "documentation": "See README.md for full documentation"
+}
+
+# Close the request's session when the request ends
+@app.teardown_appcontext
+def remove_session(exception=None):
+    db_session.remove()
+
+# Time each request and count its SQL statements
+@app.before_request
+def start_request_metrics():
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    finish_request_metrics(response.status_code)
+    return response
+
+# A request that raised never reaches after_request
+@app.teardown_request
+def record_failed_request_metrics(exception=None):
+    finish_request_metrics(500)
+
+def finish_request_metrics(status):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        # Label by URL rule, not path, so every short code shares one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.finish_request(token, request.method, route, status, slow_ms=config.SLOW_REQUEST_MS)
 
 # Helper function to generate a random short code
 def generate_short_code(length=6):
     chars = string.ascii_letters + string.digits
     return ''.join(random.choice(chars) for _ in range(length))
 
-# Simulate fraud validation (takes 500ms, returns True/False with 50% probability)
-def validate_click():
+# Click rates per visitor and link over a sliding window, the features of the fraud check
+click_rate_scorer = ClickRateScorer(window=config.FRAUD_RATE_WINDOW)
+
+# Rate rules over every click of a batch, repeats answered from the verdict cache included:
+# clicks from visitors above the rate limits are invalid without calling the validator
+def screen_clicks(batch):
+    features = click_rate_scorer.features(batch)
+    return rate_rules(features, config.FRAUD_MAX_VISITOR_RATE, config.FRAUD_MAX_VISITOR_LINK_RATE)
+
+# Simulate batch fraud scoring: one 500ms call for the whole batch, each click valid with
+# 50% probability
+def validate_clicks(batch):
     time.sleep(0.5)  # 500ms delay
-    return random.choice([True, False])  # 50% probability
+    return [random.choice([True, False]) for _ in batch]  # 50% probability
+
+# Simulate fraud validation of a single click (takes 500ms, returns True/False with 50% probability)
+def validate_click(click=None):
+    return validate_clicks([click or PendingClick(None, None, None)])[0]
+
+# Pick the configured short code allocator
+def make_short_code_allocator():
+    if config.SHORT_CODE_ALLOCATOR == "random":
+        return RandomCodeAllocator(lambda: generate_short_code(config.SHORT_CODE_LENGTH))
+    if config.SHORT_CODE_ALLOCATOR == "sequence":
+        return SequenceCodeAllocator(
+            config.SHORT_CODE_KEY,
+            length=config.SHORT_CODE_LENGTH,
+            block_size=config.SHORT_CODE_BLOCK_SIZE
+        )
+    raise ValueError(f"Unknown SHORT_CODE_ALLOCATOR: {config.SHORT_CODE_ALLOCATOR}")
+
+short_code_allocator = make_short_code_allocator()
+
+# Recent verdicts per visitor and link, so repeat clicks skip the validator
+verdict_cache = VerdictCache(
+    max_size=config.VERDICT_CACHE_SIZE,
+    window=config.VERDICT_CACHE_WINDOW
+) if config.VERDICT_CACHE_SIZE > 0 else None
+
+# Rendered /stats pages; bumped after every write of links or click counters
+stats_cache = ResponseCache(
+    max_size=config.STATS_CACHE_SIZE,
+    max_age=config.STATS_CACHE_MAX_AGE
+)
+
+# Background fraud validation for recorded clicks
+validation_pipeline = ValidationPipeline(
+    Session,
+    lambda batch: validate_clicks(batch),
+    workers=config.VALIDATION_WORKERS,
+    batch_size=config.VALIDATION_BATCH_SIZE,
+    max_queue=config.VALIDATION_QUEUE_SIZE,
+    max_retries=config.VALIDATION_MAX_RETRIES,
+    retry_delay=config.VALIDATION_RETRY_DELAY,
+    on_validate=lambda seconds, verdicts: metrics.observe_validation(seconds, verdicts),
+    verdict_cache=verdict_cache,
+    repeat_policy=config.VERDICT_REPEAT_POLICY,
+    on_apply=lambda count: stats_cache.bump(),
+    screen=lambda batch: screen_clicks(batch)
+)
+
+# Health of the read replica, which serves link lookups and statistics while it keeps up
+replica_monitor = ReplicaMonitor(
+    replica_engine,
+    max_lag=config.REPLICA_MAX_LAG,
+    check_interval=config.REPLICA_CHECK_INTERVAL
+) if replica_engine is not None else None
+
+# Expiry (Unix time) of a client's read-your-writes window, set when it creates links
+PRIMARY_COOKIE = "read_primary_until"
+
+# Approximate row counts from the statistics catalogs, for /hello
+row_counts = ResponseCache(max_size=1, max_age=config.ROW_COUNT_MAX_AGE)
+
+# Cache of short_code -> target URL for the redirect path
+link_cache = LinkCache(
+    max_size=config.LINK_CACHE_SIZE,
+    ttl=config.LINK_CACHE_TTL,
+    negative_ttl=config.LINK_CACHE_NEGATIVE_TTL
+)
+
+# Most clicked short codes; the top ones stay pinned in the link cache
+hot_links = HeavyHitters(
+    capacity=config.HOT_LINKS_CAPACITY,
+    half_life=config.HOT_LINKS_HALF_LIFE,
+    on_refresh=lambda tracker: pin_hot_links(tracker),
+    refresh_interval=config.HOT_LINKS_REFRESH
+)
+
+def pin_hot_links(tracker):
+    link_cache.pin(short_code for short_code, _, _ in tracker.top(config.HOT_LINKS_PINNED))
+
+# Freshly written clicks changed the click counters; queue them for fraud validation
+def clicks_written(clicks):
+    stats_cache.bump()
+    for click_id, link_id, clicked_at, fingerprint in clicks:
+        validation_pipeline.submit(PendingClick(click_id, link_id, clicked_at, fingerprint))
+
+# Clicks waiting to be written to the database in bulk: spooled to local disk, so they
+# survive restarts and database outages, or kept in memory when no spool is configured
+if config.CLICK_SPOOL_DIR:
+    click_buffer = ClickSpool(
+        config.CLICK_SPOOL_DIR,
+        Session,
+        on_flush=clicks_written,
+        flush_interval=config.CLICK_FLUSH_INTERVAL_MS / 1000,
+        max_events=config.CLICK_FLUSH_MAX_EVENTS,
+        segment_bytes=config.CLICK_SPOOL_SEGMENT_BYTES
+    )
+else:
+    click_buffer = ClickBuffer(
+        Session,
+        on_flush=clicks_written,
+        flush_interval=config.CLICK_FLUSH_INTERVAL_MS / 1000,
+        max_events=config.CLICK_FLUSH_MAX_EVENTS,
+        max_buffered=config.CLICK_BUFFER_MAX
+    )
+
+# Write buffered clicks and finish queued validations before the process exits
+@atexit.register
+def shutdown():
+    click_buffer.close()
+    validation_pipeline.stop(timeout=config.SHUTDOWN_TIMEOUT)
+    if replica_monitor is not None:
+        replica_monitor.stop()
+
+# Load the most clicked links of the last CACHE_PREWARM_MONTHS months into the link cache, so a
+# freshly started worker does not send a wave of lookups to the database; returns how many
+def prewarm_link_cache(limit=config.CACHE_PREWARM_LINKS, months=config.CACHE_PREWARM_MONTHS):
+    limit = min(limit, link_cache.max_size)
+    if limit <= 0:
+        return 0
+    now = partitions.utcnow()
+    since = partitions.add_months(partitions.month_start(now.year, now.month), 1 - months)
+    session = Session()
+    try:
+        rows = most_clicked_links(session, limit, since.strftime('%Y-%m'))
+    finally:
+        session.close()
+    # Least clicked first, so the most clicked end up most recently used
+    for short_code, link_id, original_url in reversed(rows):
+        link_cache.put(short_code, CachedLink(link_id, original_url))
+    return len(rows)
+
+# Identify a visitor by client address and user agent, hashed so neither is kept in memory
+def visitor_fingerprint(remote_addr, user_agent):
+    return hashlib.blake2b(f"{remote_addr}\n{user_agent}".encode(), digest_size=16).digest()
+
+# JSON description of a short link, as returned by the link creation endpoints
+def link_response(link, host_url, **extra):
+    data = {
+        "original_url": link.original_url,
+        "short_code": link.short_code,
+        "short_url": host_url + link.short_code,
+        "created_at": link.created_at.isoformat()
+    }
+    data.update(extra)
+    return data
+
+# Why a {target_url, seller_id} link request cannot be created, or None if it can. Checked
+# before the database, so POST /links and every batch item reject the same requests.
+def link_item_error(item):
+    if not isinstance(item, dict) or 'target_url' not in item:
+        return "Missing target_url parameter"
+    if 'seller_id' not in item:
+        # In a real app, this might come from authentication
+        return "Missing seller_id parameter"
+    if not isinstance(item['target_url'], str) or not item['target_url']:
+        return "Invalid target_url parameter"
+    if not isinstance(item['seller_id'], str) or not item['seller_id']:
+        return "Invalid seller_id parameter"
+    if len(item['seller_id']) > Link.seller_id.type.length:
+        return f"seller_id is longer than {Link.seller_id.type.length} characters"
+    return None
+
+# Split a batch of {target_url, seller_id} items into the (seller_id, target_url) pairs to
+# resolve and their positions; invalid items get an error in their slot of the results
+def parse_batch_items(items):
+    results = [None] * len(items)
+    pairs = []
+    positions = []
+    for position, item in enumerate(items):
+        # Each item is checked on its own, so one malformed item does not fail the batch
+        error = link_item_error(item)
+        if error:
+            results[position] = {"error": error}
+        else:
+            pairs.append((item['seller_id'], item['target_url']))
+            positions.append(position)
+    return results, pairs, positions
+
+# Fill the batch results with the resolved links and count what was created
+def batch_response(results, positions, links, host_url):
+    created = 0
+    for position, (link, is_new) in zip(positions, links):
+        results[position] = link_response(link, host_url, status="created" if is_new else "existing")
+        if is_new:
+            created += 1
+            # The code may have been cached as unknown before it existed
+            link_cache.invalidate(link.short_code)
+    if created:
+        stats_cache.bump()
+
+    return {
+        "results": results,
+        "created": created,
+        "existing": len(links) - created,
+        "failed": len(results) - len(links)
+    }
+
+# Rendered /stats page as (body, etag, next cursor). The ETag is a hash of the body, so it
+# changes exactly when the bytes do (a strong validator).
+def render_stats_page(entries, next_key):
+    body = app.json.dumps(entries).encode()
+    next_cursor = encode_cursor(next_key) if next_key is not None else None
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest(), next_cursor
+
+# Metrics of every component, in Prometheus text format
+def render_metrics(pool_stats):
+    return metrics.render({
+        "fiverr_validation": validation_pipeline.stats(),
+        "fiverr_link_cache": link_cache.stats(),
+        "fiverr_stats_cache": stats_cache.stats(),
+        "fiverr_hot_links": hot_links.stats(),
+        "fiverr_click_buffer": click_buffer.stats(),
+        "fiverr_db_pool": pool_stats,
+        **replica_stats()
+    })
+
+def replica_stats():
+    if replica_monitor is None:
+        return {}
+    return {
+        "fiverr_replica": replica_monitor.stats(),
+        "fiverr_replica_pool": replica_pool_metrics.snapshot(replica_engine.pool)
+    }
+
+# Whether the client created links within READ_YOUR_WRITES_WINDOW seconds; the replica may
+# not have them yet, so its reads go to the primary
+def wrote_recently(cookies):
+    try:
+        return float(cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+# Open the client's read-your-writes window after it created links
+def read_your_writes(response):
+    if replica_monitor is not None:
+        window = config.READ_YOUR_WRITES_WINDOW
+        response.set_cookie(PRIMARY_COOKIE, str(int(time.time()) + window), max_age=window, httponly=True)
+    return response
+
+# Whether this request may read from the replica
+def replica_readable():
+    return replica_monitor is not None and not wrote_recently(request.cookies) and replica_monitor.use_replica()
+
+# Run query(session) on the replica when this request may read from it, else on the request's
+# session on the primary. When the replica fails (any driver error, e.g. a dropped connection,
+# or a pool timeout) the query runs again on the primary, as it does when stale(result) says
+# the result may only be missing something the replica has not replayed yet.
+def read(query, stale=None):
+    if replica_readable():
+        session = Session(bind=replica_engine)
+        try:
+            result = query(session)
+            if stale is None or not stale(result):
+                return result
+        except (exc.DBAPIError, exc.TimeoutError):
+            replica_monitor.failed()
+            log.warning("Read replica failed, reading from the primary", exc_info=True)
+        finally:
+            session.close()
+    return query(db_session())
+
+# Read the /stats pagination parameters: (per_page, offset, after).
+# Raises ValueError for a cursor that cannot be decoded.
+def parse_stats_args(args):
+    page = args.get('page', 1, type=int)
+    per_page = args.get('per_page', 10, type=int)
+    cursor = args.get('cursor')
+
+    # Limit per_page to a reasonable value
+    per_page = min(per_page, 100)
+
+    # Calculate offset
+    offset = (page - 1) * per_page
+
+    # A cursor (empty for the first page) switches to keyset pagination
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+    if cursor is not None:
+        offset = 0
+    return per_page, offset, after
+
+# Load what the redirect needs about a link, or None if the code is unknown. Links are
+# created on the primary, so a code the replica does not know is looked up there too.
+def load_link(short_code):
+    return read(lambda session: find_link(session, short_code), stale=lambda link: link is None)
+
+def find_link(session, short_code):
+    row = session.query(Link.id, Link.original_url).filter_by(short_code=short_code).first()
+    return CachedLink(*row) if row else None
 
 # -----------------------------
 # POST /links - Create a new short link
@@ -30,146 +393,87 @@ def validate_click():
 def create_short_link():
     # Get JSON data from request
     data = request.json
-    if not data or 'target_url' not in data:
-        return jsonify({"error": "Missing target_url parameter"}), 400
-
-    if 'seller_id' not in data:
-        # In a real app, this might come from authentication
-        return jsonify({"error": "Missing seller_id parameter"}), 400
+    error = link_item_error(data)
+    if error:
+        return jsonify({"error": error}), 400
 
     target_url = data['target_url']
     seller_id = data['seller_id']
 
-    # Create a session
-    session = Session()
+    # The request's session
+    session = db_session()
     try:
-        # Check if this URL already exists for this seller
-        existing_link = session.query(Link).filter_by(
-            original_url=target_url,
-            seller_id=seller_id
-        ).first()
+        # Find the link for this seller and URL, creating it with a new short code if needed
+        [(link, is_new)] = get_or_create_links(session, short_code_allocator, [(seller_id, target_url)])
+        session.commit()
 
-        if existing_link:
+        if not is_new:
             # Return the existing short link
-            return jsonify({
-                "original_url": existing_link.original_url,
-                "short_code": existing_link.short_code,
-                "short_url": request.host_url + existing_link.short_code,
-                "created_at": existing_link.created_at.isoformat(),
-                "message": "Existing link returned"
-            })
-
-        # Generate a unique short code
-        while True:
-            short_code = generate_short_code()
-            if not session.query(Link).filter_by(short_code=short_code).first():
-                break
-
-        # Create a new link
-        new_link = Link(
-            original_url=target_url,
-            short_code=short_code,
-            seller_id=seller_id
-        )
+            return jsonify(link_response(link, request.host_url, message="Existing link returned"))
 
-        session.add(new_link)
-        session.commit()
+        # The code may have been cached as unknown before it existed
+        link_cache.invalidate(link.short_code)
+        stats_cache.bump()
 
-        return jsonify({
-            "original_url": new_link.original_url,
-            "short_code": new_link.short_code,
-            "short_url": request.host_url + new_link.short_code,
-            "created_at": new_link.created_at.isoformat()
-        }), 201
+        return read_your_writes(jsonify(link_response(link, request.host_url))), 201
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# -----------------------------
+# POST /links/batch - Create many short links at once
+# -----------------------------
+@app.post("/links/batch")
+def create_short_links_batch():
+    # Get JSON data from request
+    data = request.json
+    if not data or not isinstance(data.get('links'), list):
+        return jsonify({"error": "Missing links parameter"}), 400
+
+    items = data['links']
+    if len(items) > config.LINK_BATCH_MAX:
+        return jsonify({"error": f"At most {config.LINK_BATCH_MAX} links per batch"}), 400
+
+    # Validate every item; invalid ones get an error in their slot of the results
+    results, pairs, positions = parse_batch_items(items)
+
+    # The request's session
+    session = db_session()
+    try:
+        links = get_or_create_links(session, short_code_allocator, pairs)
+        session.commit()
+        data = batch_response(results, positions, links, request.host_url)
+        response = jsonify(data)
+        return read_your_writes(response) if data['created'] else response
 
     except Exception as e:
         session.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
 
 # -----------------------------
 # GET /:short_code - Redirect and track
 # -----------------------------
 @app.get("/<short_code>")
 def redirect_short_link(short_code):
-    # Create a session
-    session = Session()
     try:
-        # Find the link
-        link = session.query(Link).filter_by(short_code=short_code).first()
+        # Find the link, from the cache when possible
+        link = link_cache.get_or_load(short_code, lambda: load_link(short_code))
 
         if not link:
             return jsonify({"error": "Link not found"}), 404
 
-        # Record the click (before validation)
-        current_time = datetime.now(timezone.utc)
-        year_month = current_time.strftime('%Y-%m')
+        hot_links.add(short_code)
 
-        # Create the click record
-        click = Click(
-            link_id=link.id,
-            clicked_at=current_time
-        )
-        session.add(click)
-
-        # Simulate fraud validation (async in a real app)
-        is_valid = validate_click()
-        click.is_valid = is_valid
-
-        # If valid, award the credit (0.05 USD) and mark as rewarded
-        if is_valid:
-            click.rewarded = True
-
-            # Update or create monthly stats
-            monthly_stat = session.query(MonthlyStat).filter_by(
-                link_id=link.id,
-                year_month=year_month
-            ).first()
-
-            if not monthly_stat:
-                monthly_stat = MonthlyStat(
-                    link_id=link.id,
-                    year_month=year_month,
-                    clicks=1,
-                    valid_clicks=1,
-                    rewards_earned=0.05  # $0.05 USD
-                )
-                session.add(monthly_stat)
-            else:
-                monthly_stat.clicks += 1
-                monthly_stat.valid_clicks += 1
-                monthly_stat.rewards_earned += 0.05  # $0.05 USD
-        else:
-            # Still update click count even if not valid
-            monthly_stat = session.query(MonthlyStat).filter_by(
-                link_id=link.id,
-                year_month=year_month
-            ).first()
-
-            if not monthly_stat:
-                monthly_stat = MonthlyStat(
-                    link_id=link.id,
-                    year_month=year_month,
-                    clicks=1,
-                    valid_clicks=0,
-                    rewards_earned=0.0
-                )
-                session.add(monthly_stat)
-            else:
-                monthly_stat.clicks += 1
-
-        # Commit all the changes
-        session.commit()
+        # Buffer the click; it is written in bulk and then validated in the background
+        fingerprint = visitor_fingerprint(request.remote_addr, request.headers.get('User-Agent', ''))
+        click_buffer.add(link.id, datetime.now(timezone.utc), fingerprint)
 
         # Redirect to the original URL
         return redirect(link.original_url)
 
     except Exception as e:
-        session.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
 
 # -----------------------------
 # GET /stats - Global analytics
@@ -177,88 +481,176 @@ def redirect_short_link(short_code):
 @app.get("/stats")
 def get_stats():
     # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    try:
+        per_page, offset, after = parse_stats_args(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor parameter"}), 400
+
+    # Served from the cache until the next write (or STATS_CACHE_MAX_AGE); a client that just
+    # created links gets a page computed on the primary, which includes them
+    key = (per_page, offset, after)
+    version, page = stats_cache.get(key)
+    if page is None or wrote_recently(request.cookies):
+        try:
+            # Get paginated links with their lifetime totals and monthly breakdown in one query
+            links_data, next_key = read(lambda session: stats_page(session, per_page, offset=offset, after=after))
+        except Exception as e:
+            db_session.rollback()
+            return jsonify({"error": str(e)}), 500
+        page = render_stats_page(links_data, next_key)
+        stats_cache.store(version, key, page)
+
+    # Return just the array as requested in the example; pollers that send back the
+    # ETag get a 304 without a body
+    body, etag, next_cursor = page
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
-    # Limit per_page to a reasonable value
-    per_page = min(per_page, 100)
+# -----------------------------
+# GET /stats/export - Every link's statistics as NDJSON
+# -----------------------------
+@app.get("/stats/export")
+def export_stats():
+    # Stream one JSON line per link; the session lives as long as the response body. A
+    # replica that fails halfway cannot fall back, the client sees a truncated stream.
+    bind = replica_engine if replica_readable() else engine
+
+    def generate():
+        session = Session(bind=bind)
+        try:
+            for entry in export_link_stats(session, batch_size=config.EXPORT_BATCH_SIZE):
+                yield json.dumps(entry) + "\n"
+        finally:
+            session.close()
+
+    return Response(generate(), mimetype="application/x-ndjson")
 
-    # Calculate offset
-    offset = (page - 1) * per_page
+# -----------------------------
+# GET /stats/top - Most clicked links right now
+# -----------------------------
+@app.get("/stats/top")
+def get_top_links():
+    limit = min(request.args.get('n', 10, type=int), 100)
 
-    # Create a session
-    session = Session()
     try:
-        # Get paginated links with their stats
-        links = session.query(Link).order_by(Link.created_at.desc()).offset(offset).limit(per_page).all()
-
-        links_data = []
-        for link in links:
-            # Get all monthly stats for this link
-            monthly_stats = session.query(MonthlyStat).filter_by(link_id=link.id).all()
-
-            # Calculate lifetime totals
-            total_clicks = sum(stat.clicks for stat in monthly_stats)
-            total_earnings = sum(stat.rewards_earned for stat in monthly_stats)
-
-            # Format monthly stats according to the required format (MM/YYYY)
-            monthly_breakdown = []
-            for stat in monthly_stats:
-                # Convert YYYY-MM to MM/YYYY
-                year, month = stat.year_month.split('-')
-                formatted_month = f"{month}/{year}"
-
-                monthly_breakdown.append({
-                    "month": formatted_month,
-                    "earnings": stat.rewards_earned
-                })
-
-            links_data.append({
-                "url": link.original_url,
-                "total_clicks": total_clicks,
-                "total_earnings": total_earnings,
-                "monthly_breakdown": monthly_breakdown
-            })
-
-        # Return just the array as requested in the example
-        return jsonify(links_data)
+        # Rates come from memory; one query adds the links' URLs and sellers
+        top = hot_links.top(limit)
+        return jsonify(read(lambda session: top_links(session, top)))
 
     except Exception as e:
+        db_session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# -----------------------------
+# GET /sellers/:seller_id/stats - Analytics of one seller
+# -----------------------------
+@app.get("/sellers/<seller_id>/stats")
+def get_seller_stats(seller_id):
+    # Same pagination parameters as /stats, applied to the seller's links
+    try:
+        per_page, offset, after = parse_stats_args(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor parameter"}), 400
+
+    try:
+        # Totals come from the seller's rollup, so the cost does not grow with their link count
+        seller_data, next_key = read(
+            lambda session: seller_stats(session, seller_id, per_page, offset=offset, after=after)
+        )
+        if seller_data is None:
+            return jsonify({"error": "Seller not found"}), 404
+
+        response = jsonify(seller_data)
+        if next_key is not None:
+            response.headers['X-Next-Cursor'] = encode_cursor(next_key)
+        return response
+
+    except Exception as e:
+        db_session.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
+
+# -----------------------------
+# GET /admin/validation - Fraud validation backlog
+# -----------------------------
+@app.get("/admin/validation")
+def validation_status():
+    return jsonify(validation_pipeline.stats())
+
+# -----------------------------
+# GET /admin/cache - Link cache counters
+# -----------------------------
+@app.get("/admin/cache")
+def cache_status():
+    return jsonify(link_cache.stats())
+
+# -----------------------------
+# GET /admin/clicks - Click buffer counters
+# -----------------------------
+@app.get("/admin/clicks")
+def click_buffer_status():
+    return jsonify(click_buffer.stats())
+
+# -----------------------------
+# GET /admin/pool - Database connection pool
+# -----------------------------
+@app.get("/admin/pool")
+def pool_status():
+    return jsonify(pool_metrics.snapshot(engine.pool))
+
+# -----------------------------
+# GET /admin/replica - Read replica health and routing
+# -----------------------------
+@app.get("/admin/replica")
+def replica_status():
+    if replica_monitor is None:
+        return jsonify({"configured": False})
+    return jsonify({
+        "configured": True,
+        **replica_monitor.stats(),
+        "pool": replica_pool_metrics.snapshot(replica_engine.pool)
+    })
+
+# -----------------------------
+# GET /metrics - Prometheus scrape endpoint
+# -----------------------------
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(render_metrics(pool_metrics.snapshot(engine.pool)), mimetype=metrics.CONTENT_TYPE)
 
 # -----------------------------
 # Root endpoint - API info
 # -----------------------------
 @app.get("/")
 def index():
-    return jsonify({
-        "message": "Welcome to Fiverr URL Shortener API",
-        "endpoints": {
-            "POST /links": "Create a new short link",
-            "GET /{short_code}": "Redirect to the original URL",
-            "GET /stats": "Get link statistics with pagination",
-            "GET /hello": "Health check endpoint"
-        },
-        "documentation": "See README.md for full documentation"
-    })
+    return jsonify(API_INFO)
 
 # -----------------------------
 # Sanity endpoint
 # -----------------------------
 @app.get("/hello")
 def hello():
-    with engine.begin() as conn:
-        val = conn.execute(
-            text("SELECT COUNT(*) FROM links")
-        ).scalar_one_or_none() or 0
-
+    # Liveness only: a probe must cost the same however large the tables grow
+    db_session.execute(text("SELECT 1"))
     return jsonify({
         "message": "Hello Fiverr",
         "db": "postgres",
-        "links_count": val
+        "links_count": approximate_row_counts(db_session.connection()).get("links", 0)
     })
 
+# Estimated rows per table, read from the catalogs at most every ROW_COUNT_MAX_AGE seconds
+def approximate_row_counts(conn):
+    version, counts = row_counts.get("tables")
+    if counts is None:
+        counts = catalog.approximate_counts(conn)
+        row_counts.store(version, "tables", counts)
+    return counts
+
 if __name__ == "__main__":
     app.run(port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,368 @@
+# The same API served on asyncio (Quart + asyncpg).
+#
+# Request handlers await the database instead of holding a thread each, so one
+# process keeps thousands of redirects and stats requests in flight with a small
+# connection pool. The click buffer, the validation pipeline, the link cache and
+# the short code allocator are shared with app.py and keep running on their
+# background threads with the synchronous engine.
+#
+#     pip install -r requirements-async.txt
+#     uvicorn async_app:app --port 5000
+import json
+import logging
+from datetime import datetime, timezone
+
+from quart import Quart, Response, g, jsonify, redirect, request
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import config
+import metrics
+from app import (API_INFO, approximate_row_counts, batch_response, click_buffer, find_link, hot_links,
+                 link_cache, link_item_error, link_response, parse_batch_items, parse_stats_args,
+                 read_your_writes, render_metrics, render_stats_page, replica_monitor, short_code_allocator,
+                 stats_cache, validation_pipeline, visitor_fingerprint, wrote_recently)
+from database import InstrumentedAsyncQueuePool, PoolMetrics
+from links import get_or_create_links
+from stats import (encode_cursor, export_entry, export_query, group_monthly_stats, seller_stats, stats_page,
+                   top_links)
+
+app = Quart(__name__)
+log = logging.getLogger(__name__)
+
+async_pool_metrics = PoolMetrics()
+async_replica_pool_metrics = PoolMetrics()
+
+# Same database and pool settings as the synchronous engine, through asyncpg
+async_engine = create_async_engine(
+    make_url(config.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    pool_recycle=config.DB_POOL_RECYCLE,
+)
+async_engine.pool.metrics = async_pool_metrics
+metrics.instrument_engine(async_engine.sync_engine)
+
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# The read replica through asyncpg; its health comes from app.replica_monitor
+async_replica_engine = create_async_engine(
+    make_url(config.DATABASE_REPLICA_URL).set(drivername="postgresql+asyncpg"),
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    pool_recycle=config.DB_POOL_RECYCLE,
+) if config.DATABASE_REPLICA_URL else None
+if async_replica_engine is not None:
+    async_replica_engine.pool.metrics = async_replica_pool_metrics
+    metrics.instrument_engine(async_replica_engine.sync_engine)
+AsyncReplicaSession = async_sessionmaker(async_replica_engine, expire_on_commit=False)
+
+# Close the pool's connections when the server stops
+@app.after_serving
+async def dispose_engine():
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
+# Time each request and count its SQL statements; the hooks are coroutines so they run
+# in the request's task and share its context with the handler
+@app.before_request
+async def start_request_metrics():
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+async def record_request_metrics(response):
+    finish_request_metrics(response.status_code)
+    return response
+
+# A request that raised never reaches after_request
+@app.teardown_request
+async def record_failed_request_metrics(exception=None):
+    finish_request_metrics(500)
+
+def finish_request_metrics(status):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        # Label by URL rule, not path, so every short code shares one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.finish_request(token, request.method, route, status, slow_ms=config.SLOW_REQUEST_MS)
+
+def replica_readable():
+    return (async_replica_engine is not None and not wrote_recently(request.cookies)
+            and replica_monitor.use_replica())
+
+# Run the synchronous query(session) on the replica when this request may read from it, else
+# on the primary; same fallbacks as app.read
+async def read(query, stale=None):
+    if replica_readable():
+        try:
+            async with AsyncReplicaSession() as session:
+                result = await session.run_sync(query)
+            if stale is None or not stale(result):
+                return result
+        except (exc.DBAPIError, exc.TimeoutError):
+            replica_monitor.failed()
+            log.warning("Read replica failed, reading from the primary", exc_info=True)
+    async with AsyncSession() as session:
+        return await session.run_sync(query)
+
+# Load what the redirect needs about a link, or None if the code is unknown. Links are
+# created on the primary, so a code the replica does not know is looked up there too.
+async def load_link(short_code):
+    return await read(lambda session: find_link(session, short_code), stale=lambda link: link is None)
+
+# -----------------------------
+# POST /links - Create a new short link
+# -----------------------------
+@app.post("/links")
+async def create_short_link():
+    # Get JSON data from request
+    data = await request.get_json(silent=True)
+    error = link_item_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    pairs = [(data['seller_id'], data['target_url'])]
+
+    async with AsyncSession() as session:
+        try:
+            # The synchronous helper runs on the session's connection without blocking the loop
+            [(link, is_new)] = await session.run_sync(get_or_create_links, short_code_allocator, pairs)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    if not is_new:
+        # Return the existing short link
+        return jsonify(link_response(link, request.host_url, message="Existing link returned"))
+
+    # The code may have been cached as unknown before it existed
+    link_cache.invalidate(link.short_code)
+    stats_cache.bump()
+
+    return read_your_writes(jsonify(link_response(link, request.host_url))), 201
+
+# -----------------------------
+# POST /links/batch - Create many short links at once
+# -----------------------------
+@app.post("/links/batch")
+async def create_short_links_batch():
+    # Get JSON data from request
+    data = await request.get_json(silent=True)
+    if not data or not isinstance(data.get('links'), list):
+        return jsonify({"error": "Missing links parameter"}), 400
+
+    items = data['links']
+    if len(items) > config.LINK_BATCH_MAX:
+        return jsonify({"error": f"At most {config.LINK_BATCH_MAX} links per batch"}), 400
+
+    # Validate every item; invalid ones get an error in their slot of the results
+    results, pairs, positions = parse_batch_items(items)
+
+    async with AsyncSession() as session:
+        try:
+            links = await session.run_sync(get_or_create_links, short_code_allocator, pairs)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    data = batch_response(results, positions, links, request.host_url)
+    response = jsonify(data)
+    return read_your_writes(response) if data['created'] else response
+
+# -----------------------------
+# GET /:short_code - Redirect and track
+# -----------------------------
+@app.get("/<short_code>")
+async def redirect_short_link(short_code):
+    try:
+        # Find the link, from the cache when possible
+        found, link = link_cache.lookup(short_code)
+        if not found:
+            link = await load_link(short_code)
+            link_cache.put(short_code, link)
+
+        if not link:
+            return jsonify({"error": "Link not found"}), 404
+
+        hot_links.add(short_code)
+
+        # Buffer the click; it is written in bulk and then validated in the background
+        fingerprint = visitor_fingerprint(request.remote_addr, request.headers.get('User-Agent', ''))
+        click_buffer.add(link.id, datetime.now(timezone.utc), fingerprint)
+
+        # Redirect to the original URL
+        return redirect(link.original_url)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# -----------------------------
+# GET /stats - Global analytics
+# -----------------------------
+@app.get("/stats")
+async def get_stats():
+    # Get pagination parameters
+    try:
+        per_page, offset, after = parse_stats_args(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor parameter"}), 400
+
+    # The cache is shared with app.py and bumped by the same writers
+    key = (per_page, offset, after)
+    version, page = stats_cache.get(key)
+    if page is None or wrote_recently(request.cookies):
+        try:
+            # Get paginated links with their lifetime totals and monthly breakdown in one query
+            links_data, next_key = await read(
+                lambda session: stats_page(session, per_page, offset=offset, after=after)
+            )
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        page = render_stats_page(links_data, next_key)
+        stats_cache.store(version, key, page)
+
+    body, etag, next_cursor = page
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# -----------------------------
+# GET /stats/export - Every link's statistics as NDJSON
+# -----------------------------
+@app.get("/stats/export")
+async def export_stats():
+    # Stream one JSON line per link, grouped by stats.group_monthly_stats one partition of
+    # rows at a time. A link's rows are consecutive but may continue in the next partition,
+    # so the rows of the last link are held back until it is complete.
+    session_factory = AsyncReplicaSession if replica_readable() else AsyncSession
+
+    async def generate():
+        async with session_factory() as session:
+            rows = await session.stream(export_query(batch_size=config.EXPORT_BATCH_SIZE))
+            pending = []
+            async for partition in rows.partitions():
+                pending.extend(partition)
+                split = len(pending)
+                while split and pending[split - 1][0] == pending[-1][0]:
+                    split -= 1
+                for link, monthly_stats in group_monthly_stats(pending[:split]):
+                    yield json.dumps(export_entry(link, monthly_stats)) + "\n"
+                pending = pending[split:]
+            for link, monthly_stats in group_monthly_stats(pending):
+                yield json.dumps(export_entry(link, monthly_stats)) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+# -----------------------------
+# GET /stats/top - Most clicked links right now
+# -----------------------------
+@app.get("/stats/top")
+async def get_top_links():
+    limit = min(request.args.get('n', 10, type=int), 100)
+
+    top = hot_links.top(limit)
+    try:
+        entries = await read(lambda session: top_links(session, top))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(entries)
+
+# -----------------------------
+# GET /sellers/:seller_id/stats - Analytics of one seller
+# -----------------------------
+@app.get("/sellers/<seller_id>/stats")
+async def get_seller_stats(seller_id):
+    try:
+        per_page, offset, after = parse_stats_args(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor parameter"}), 400
+
+    try:
+        seller_data, next_key = await read(
+            lambda session: seller_stats(session, seller_id, per_page, offset=offset, after=after)
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if seller_data is None:
+        return jsonify({"error": "Seller not found"}), 404
+    response = jsonify(seller_data)
+    if next_key is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_key)
+    return response
+
+# -----------------------------
+# Admin endpoints
+# -----------------------------
+@app.get("/admin/validation")
+async def validation_status():
+    return jsonify(validation_pipeline.stats())
+
+@app.get("/admin/cache")
+async def cache_status():
+    return jsonify(link_cache.stats())
+
+@app.get("/admin/clicks")
+async def click_buffer_status():
+    return jsonify(click_buffer.stats())
+
+# Pool of the asyncio engine that serves the requests
+@app.get("/admin/pool")
+async def pool_status():
+    return jsonify(async_pool_metrics.snapshot(async_engine.pool))
+
+# Health of the replica, shared with app.py, and the asyncio replica pool
+@app.get("/admin/replica")
+async def replica_status():
+    if async_replica_engine is None:
+        return jsonify({"configured": False})
+    return jsonify({
+        "configured": True,
+        **replica_monitor.stats(),
+        "pool": async_replica_pool_metrics.snapshot(async_replica_engine.pool)
+    })
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(render_metrics(async_pool_metrics.snapshot(async_engine.pool)), mimetype=metrics.CONTENT_TYPE)
+
+# -----------------------------
+# Root endpoint - API info
+# -----------------------------
+@app.get("/")
+async def index():
+    return jsonify(API_INFO)
+
+# -----------------------------
+# Sanity endpoint
+# -----------------------------
+@app.get("/hello")
+async def hello():
+    async with AsyncSession() as session:
+        await session.execute(text("SELECT 1"))
+        counts = await session.run_sync(lambda sync_session: approximate_row_counts(sync_session.connection()))
+
+    return jsonify({
+        "message": "Hello Fiverr",
+        "db": "postgres",
+        "links_count": counts.get("links", 0)
+    })
+
+if __name__ == "__main__":
+    app.run(port=5000)
@@ -0,0 +1,35 @@
+from sqlalchemy import text
+from database import engine
+from models import SellerMonthlyStat
+
+# Add seller_monthly_stats and the (seller_id, created_at, id) index on links to a database
+# created before they existed, and rebuild the rollup from monthly_stats. Safe to run again;
+# every run recomputes the rollup from scratch.
+def backfill_seller_stats():
+    SellerMonthlyStat.__table__.create(engine, checkfirst=True)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_links_seller_created_at_id "
+            "ON links (seller_id, created_at, id)"
+        ))
+    print("Index ix_links_seller_created_at_id is in place.")
+
+    with engine.begin() as conn:
+        # Counter upserts write monthly_stats and seller_monthly_stats in one transaction;
+        # holding monthly_stats still makes them wait until the rollup matches it again
+        conn.execute(text("LOCK TABLE monthly_stats IN SHARE MODE"))
+        conn.execute(text("DELETE FROM seller_monthly_stats"))
+        rows = conn.execute(text("""
+            INSERT INTO seller_monthly_stats (seller_id, year_month, clicks, valid_clicks, rewards_earned)
+            SELECT l.seller_id, m.year_month, SUM(m.clicks), SUM(m.valid_clicks), SUM(m.rewards_earned)
+            FROM monthly_stats m
+            JOIN links l ON l.id = m.link_id
+            GROUP BY l.seller_id, m.year_month
+        """)).rowcount
+
+    print(f"Rebuilt seller_monthly_stats: {rows} seller/month rows.")
+
+if __name__ == "__main__":
+    backfill_seller_stats()
@@ -0,0 +1,65 @@
+import sys
+from sqlalchemy import bindparam, inspect, select, text, tuple_, update
+from database import engine
+from links import url_hash
+from models import Link
+
+# Add links.url_hash to a database created before it existed, fill it in for every link
+# and build the unique (seller_id, url_hash) index. Safe to run again after an interruption.
+#
+# Links that duplicate an earlier link of the same seller (same normalized URL) keep a NULL
+# url_hash: they still redirect, while lookups and new links resolve to the earliest one.
+def backfill_url_hash(batch_size=10000):
+    columns = [c['name'] for c in inspect(engine).get_columns('links')]
+    if 'url_hash' not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE links ADD COLUMN url_hash BYTEA"))
+        print("Added column links.url_hash")
+
+    filled = duplicates = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(Link.id, Link.seller_id, Link.original_url)
+                .where(Link.id > last_id, Link.url_hash.is_(None))
+                .order_by(Link.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Skip fingerprints already taken, by earlier batches or earlier rows of this one
+            keys = {row.id: (row.seller_id, url_hash(row.original_url)) for row in rows}
+            taken = set(conn.execute(
+                select(Link.seller_id, Link.url_hash)
+                .where(tuple_(Link.seller_id, Link.url_hash).in_(list(set(keys.values()))))
+            ).all())
+            updates = []
+            for link_id, key in keys.items():
+                if key in taken:
+                    duplicates += 1
+                    continue
+                taken.add(key)
+                updates.append({"link_id": link_id, "digest": key[1]})
+
+            if updates:
+                conn.execute(
+                    update(Link.__table__).where(Link.__table__.c.id == bindparam("link_id"))
+                    .values(url_hash=bindparam("digest")),
+                    updates
+                )
+            filled += len(updates)
+        print(f"Backfilled {filled} links ({duplicates} duplicates left without a hash)")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_links_seller_url_hash "
+            "ON links (seller_id, url_hash)"
+        ))
+    print("Index uq_links_seller_url_hash is in place.")
+
+if __name__ == "__main__":
+    backfill_url_hash(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,64 @@
+"""Compare two bench_load reports and flag regressions.
+
+A scenario regresses when its throughput drops, or its p50 or p99 latency grows,
+by more than --threshold percent, or when it has errors. The exit status is 1
+if anything regressed, so the comparison can gate a CI job.
+
+    python -m benchmarks.compare baseline.json report.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metric -> True when higher is better
+METRICS = {"requests_per_second": True, "p50_ms": False, "p99_ms": False}
+
+
+def compare(baseline, current, threshold):
+    rows = []
+    regressions = []
+    for scenario, result in current["results"].items():
+        before = baseline["results"].get(scenario)
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            worse = -change if higher_is_better else change
+            regressed = worse > threshold
+            rows.append((scenario, metric, old, new, change, regressed))
+            if regressed:
+                regressions.append(f"{scenario} {metric}")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{scenario} errors")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline["dataset"] != current["dataset"]:
+        print("Warning: the reports were made on different datasets")
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    print(f"{'scenario':<12} {'metric':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+    for scenario, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{scenario:<12} {metric:<20} {old:>10} {new:>10} {change:>7.1f}%{flag}")
+
+    if regressions:
+        print("Regressed: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
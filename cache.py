@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# What the redirect needs to know about a link; never changes once the link is created
+CachedLink = namedtuple("CachedLink", ["id", "original_url"])
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry.
+
+    Entries expire ttl seconds after they are stored; past max_size entries
+    the least recently used one is evicted. Any value may be cached, None
+    and False included.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    # Return the cached value for key, calling loader() on a miss
+    def get_or_load(self, key, loader):
+        found, value = self.lookup(key)
+        if found:
+            return value
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, self.ttl)
+
+    # Drop a single entry, e.g. when the data behind it changed
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        stats["max_size"] = self.max_size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # (True, value) when key is cached, (False, None) otherwise
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self._count_hit(value)
+                    return True, value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+            self._counters["misses"] += 1
+            return False, None
+
+    # Called with the lock held
+    def _count_hit(self, value):
+        self._counters["hits"] += 1
+
+    # Called with the lock held
+    def _store(self, key, value, ttl):
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    # Called with the lock held
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+
+class LinkCache(TTLCache):
+    """Bounded LRU cache of short_code -> CachedLink with per-entry expiry.
+
+    Unknown short codes are cached too (as None) with a shorter TTL so scans
+    of random codes do not reach the database. Pinned codes (the hottest links,
+    see pin()) are kept apart from the LRU: they never expire and the long
+    tail cannot evict them.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0, negative_ttl=5.0, clock=time.monotonic):
+        super().__init__(max_size=max_size, ttl=ttl, clock=clock)
+        self.negative_ttl = negative_ttl
+        self._pinned = {}  # short_code -> CachedLink
+        self._pin_wanted = set()
+        self._counters.update({"negative_hits": 0, "pinned_hits": 0})
+
+    # value is a CachedLink, or None when the code does not exist
+    def put(self, short_code, value):
+        with self._lock:
+            if value is None:
+                self._store(short_code, value, self.negative_ttl)
+            elif short_code in self._pin_wanted:
+                self._pinned[short_code] = value
+            else:
+                self._store(short_code, value, self.ttl)
+
+    # Keep exactly these codes pinned. Codes not cached yet are pinned when they are loaded;
+    # codes that drop out go back to the LRU with a fresh TTL.
+    def pin(self, short_codes):
+        with self._lock:
+            self._pin_wanted = set(short_codes)
+            expires_at = self._clock() + self.ttl
+            for short_code in list(self._pinned):
+                if short_code not in self._pin_wanted:
+                    self._entries[short_code] = (expires_at, self._pinned.pop(short_code))
+            for short_code in self._pin_wanted:
+                entry = self._entries.get(short_code)
+                if entry is not None and entry[1] is not None:
+                    del self._entries[short_code]
+                    self._pinned[short_code] = entry[1]
+            self._evict()
+
+    # Drop a single entry, e.g. when a link is created for a previously unknown code
+    def invalidate(self, short_code):
+        with self._lock:
+            if (self._entries.pop(short_code, None) or self._pinned.pop(short_code, None)) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._pin_wanted = set()
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["pinned"] = len(self._pinned)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def lookup(self, short_code):
+        with self._lock:
+            value = self._pinned.get(short_code)
+            if value is not None:
+                self._counters["hits"] += 1
+                self._counters["pinned_hits"] += 1
+                return True, value
+        return super().lookup(short_code)
+
+    def _count_hit(self, value):
+        self._counters["hits" if value is not None else "negative_hits"] += 1
+
+
+class VerdictCache(TTLCache):
+    """Recent fraud verdicts keyed by (visitor fingerprint, link_id).
+
+    A visitor who clicks the same link again within window seconds gets the
+    earlier verdict instead of another call to the validator. Bounded to
+    max_size entries like the link cache.
+    """
+
+    def __init__(self, max_size=100000, window=60.0, clock=time.monotonic):
+        super().__init__(max_size=max_size, ttl=window, clock=clock)
+
+
+class ResponseCache(TTLCache):
+    """Rendered responses keyed by their request parameters and a data version.
+
+    Writers call bump() after committing anything the responses depend on, so
+    entries computed before the write are never served again. Entries also
+    expire after max_age seconds, which bounds the staleness caused by writes
+    this process does not see (other workers, scripts).
+    """
+
+    def __init__(self, max_size=1000, max_age=5.0, clock=time.monotonic):
+        super().__init__(max_size=max_size, ttl=max_age, clock=clock)
+        self.version = 0
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+
+    # (version, cached value or None) for key. Take the version before reading the data
+    # and store the fresh value under it, so a write in between is not hidden.
+    def get(self, key):
+        version = self.version
+        found, value = self.lookup((version, key))
+        return version, value if found else None
+
+    def store(self, version, key, value):
+        self.put((version, key), value)
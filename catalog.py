@@ -0,0 +1,140 @@
+from sqlalchemy import text
+
+# Columns the hot queries filter or join on, by table; each tuple should be the leading
+# columns of some index
+HOT_COLUMNS = {
+    "links": [("short_code",), ("seller_id", "url_hash"), ("created_at", "id"), ("seller_id", "created_at")],
+    "clicks": [("link_id", "clicked_at"), ("event_id", "clicked_at")],
+    "monthly_stats": [("link_id", "year_month")],
+    "seller_monthly_stats": [("seller_id", "year_month")],
+}
+
+# Every query below reads the statistics catalogs only, so it costs the same however many
+# rows the tables hold. Partitions are folded into their partitioned parent.
+PARENT_OF = """
+    SELECT c.oid, COALESCE(p.relname, c.relname) AS table_name
+    FROM pg_class c
+    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+    LEFT JOIN pg_class p ON p.oid = i.inhparent
+    WHERE c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace
+"""
+
+
+# Partitions of each partitioned table, by parent name. Tools that list tables skip the
+# partitions: their rows are counted with the parent.
+def partitions_by_parent(conn):
+    rows = conn.execute(text("""
+        SELECT p.relname, c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relkind = 'r' AND c.relispartition AND c.relnamespace = 'public'::regnamespace
+        ORDER BY p.relname, c.relname
+    """))
+    partitions = {}
+    for parent, partition in rows:
+        partitions.setdefault(parent, []).append(partition)
+    return partitions
+
+
+# Estimated rows per table: live tuples counted by the statistics collector, which follows
+# inserts and deletes as they commit, or the planner's estimate from the last ANALYZE
+def approximate_counts(conn):
+    rows = conn.execute(text(f"""
+        SELECT t.table_name,
+               SUM(COALESCE(s.n_live_tup, GREATEST(c.reltuples, 0)))::bigint AS estimate
+        FROM ({PARENT_OF}) t
+        JOIN pg_class c ON c.oid = t.oid
+        LEFT JOIN pg_stat_user_tables s ON s.relid = t.oid
+        GROUP BY t.table_name
+    """))
+    return {table_name: estimate for table_name, estimate in rows}
+
+
+# Estimated rows and on-disk size (table, indexes and TOAST) per table, with its scan counts
+def table_sizes(conn):
+    rows = conn.execute(text(f"""
+        SELECT t.table_name,
+               SUM(COALESCE(s.n_live_tup, GREATEST(c.reltuples, 0)))::bigint AS estimated_rows,
+               SUM(pg_total_relation_size(t.oid))::bigint AS total_bytes,
+               SUM(COALESCE(s.seq_scan, 0))::bigint AS seq_scans,
+               SUM(COALESCE(s.idx_scan, 0))::bigint AS index_scans
+        FROM ({PARENT_OF}) t
+        JOIN pg_class c ON c.oid = t.oid
+        LEFT JOIN pg_stat_user_tables s ON s.relid = t.oid
+        GROUP BY t.table_name
+        ORDER BY total_bytes DESC
+    """))
+    return [dict(row._mapping) for row in rows]
+
+
+# Scans and size of every index, partition indexes folded into their table's index name
+def index_usage(conn):
+    rows = conn.execute(text(f"""
+        SELECT t.table_name, COALESCE(pi.relname, s.indexrelname) AS index_name,
+               SUM(s.idx_scan)::bigint AS scans,
+               SUM(pg_relation_size(s.indexrelid))::bigint AS bytes
+        FROM pg_stat_user_indexes s
+        JOIN ({PARENT_OF}) t ON t.oid = s.relid
+        LEFT JOIN pg_inherits i ON i.inhrelid = s.indexrelid
+        LEFT JOIN pg_class pi ON pi.oid = i.inhparent
+        GROUP BY t.table_name, COALESCE(pi.relname, s.indexrelname)
+        ORDER BY t.table_name, index_name
+    """))
+    return [dict(row._mapping) for row in rows]
+
+
+# (table, columns) of HOT_COLUMNS that no valid index starts with
+def missing_indexes(conn):
+    rows = conn.execute(text("""
+        SELECT t.relname,
+               ARRAY(SELECT a.attname
+                     FROM unnest(ix.indkey) WITH ORDINALITY AS k(attnum, position)
+                     JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+                     ORDER BY k.position) AS columns
+        FROM pg_index ix
+        JOIN pg_class t ON t.oid = ix.indrelid
+        WHERE t.relnamespace = 'public'::regnamespace AND t.relname = ANY(:tables)
+          AND (ix.indisvalid OR t.relkind = 'p')
+    """), {"tables": list(HOT_COLUMNS)})
+    indexed = {}
+    for table_name, columns in rows:
+        indexed.setdefault(table_name, []).append(tuple(columns))
+
+    missing = []
+    for table_name, wanted in HOT_COLUMNS.items():
+        if table_name not in indexed:
+            continue  # table does not exist here
+        for columns in wanted:
+            if not any(index[:len(columns)] == columns for index in indexed[table_name]):
+                missing.append((table_name, columns))
+    return missing
+
+
+def format_bytes(size):
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+# The fast diagnostics report of check_db.py and db_info.py
+def print_report(conn):
+    print("\n===== TABLES (estimated from statistics) =====")
+    for row in table_sizes(conn):
+        print(f"- {row['table_name']}: ~{row['estimated_rows']} rows, {format_bytes(row['total_bytes'])}, "
+              f"{row['seq_scans']} sequential / {row['index_scans']} index scans")
+
+    print("\n===== INDEX USAGE =====")
+    for row in index_usage(conn):
+        unused = "  (never used)" if not row['scans'] else ""
+        print(f"- {row['table_name']}.{row['index_name']}: {row['scans']} scans, "
+              f"{format_bytes(row['bytes'])}{unused}")
+
+    print("\n===== MISSING INDEXES =====")
+    missing = missing_indexes(conn)
+    for table_name, columns in missing:
+        print(f"- {table_name} ({', '.join(columns)})")
+    if not missing:
+        print("None: every hot query column is indexed.")
@@ -1,14 +1,29 @@
+import argparse
 from sqlalchemy import inspect, text
 from database import engine
+import catalog
+
+parser = argparse.ArgumentParser(description="Show the tables, row counts and sample rows")
+parser.add_argument("--fast", action="store_true",
+                    help="estimate row counts from the statistics catalogs instead of counting "
+                         "(no full scans) and report table sizes, index usage and missing indexes")
+args = parser.parse_args()
 
 # Create an inspector
 inspector = inspect(engine)
 
-# Get list of all tables
-tables = inspector.get_table_names()
+# Get list of all tables; partitions are counted with their parent table
+with engine.connect() as conn:
+    partitions = catalog.partitions_by_parent(conn)
+    if args.fast:
+        estimates = catalog.approximate_counts(conn)
+partition_names = {name for names in partitions.values() for name in names}
+tables = [table for table in inspector.get_table_names() if table not in partition_names]
 print("\n===== DATABASE TABLES =====")
 for table in tables:
     print(f"\nTable: {table}")
+    if table in partitions:
+        print(f"  Partitions: {len(partitions[table])} ({partitions[table][0]} .. {partitions[table][-1]})")
     # Get columns for each table
     columns = inspector.get_columns(table)
     print("  Columns:")
@@ -16,6 +31,9 @@ for table in tables:
         print(f"    - {column['name']} ({column['type']})")
 
     # Get row count for each table
+    if args.fast:
+        print(f"  Row count: ~{estimates.get(table, 0)}")
+        continue
     with engine.connect() as conn:
         count = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
         print(f"  Row count: {count}")
@@ -41,4 +59,8 @@ with engine.connect() as conn:
             for row in clicks_data:
                 print(f"  - ID: {row[0]}, Link ID: {row[1]}, Valid: {row[3]}, Rewarded: {row[4]}")
         else:
-            print("\nNo data in clicks table.")
\ No newline at end of file
+            print("\nNo data in clicks table.")
+
+if args.fast:
+    with engine.connect() as conn:
+        catalog.print_report(conn)
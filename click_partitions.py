@@ -0,0 +1,105 @@
+import argparse
+import logging
+from sqlalchemy import inspect, text
+from database import engine
+from models import Click
+import partitions
+import config
+
+# Convert an existing, unpartitioned clicks table to the monthly partitioned layout.
+# Rows are copied inside one transaction, so redirects block on the click buffer's
+# inserts until it commits (the buffer keeps them in memory meanwhile). Safe to run
+# more than once.
+def migrate():
+    with engine.begin() as conn:
+        partitioned = conn.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE relname = 'clicks'"
+        )).scalar()
+        if partitioned is None:
+            print("No clicks table, nothing to migrate; create_tables.py creates it partitioned.")
+            return
+        if partitioned:
+            print("clicks is already partitioned, nothing to do.")
+            return
+
+        conn.execute(text("LOCK TABLE clicks IN EXCLUSIVE MODE"))
+
+        # Move the old table and everything named after it out of the way
+        conn.execute(text("ALTER TABLE clicks RENAME TO clicks_unpartitioned"))
+        conn.execute(text("ALTER SEQUENCE IF EXISTS clicks_id_seq RENAME TO clicks_unpartitioned_id_seq"))
+        for constraint in ('clicks_pkey', 'clicks_link_id_fkey'):
+            conn.execute(text(f"""
+                DO $$ BEGIN
+                    ALTER TABLE clicks_unpartitioned RENAME CONSTRAINT {constraint} TO {constraint}_unpartitioned;
+                EXCEPTION WHEN undefined_object THEN NULL;
+                END $$
+            """))
+        conn.execute(text("DROP INDEX IF EXISTS ix_clicks_pending"))
+
+        Click.__table__.create(conn)
+
+        # Partitions for every month that has clicks, then the rows themselves
+        oldest = conn.execute(text("SELECT min(clicked_at) FROM clicks_unpartitioned")).scalar()
+        if oldest is not None:
+            now = partitions.utcnow()
+            months_back = (now.year - oldest.year) * 12 + now.month - oldest.month
+            partitions.ensure_partitions(conn, months_ahead=config.CLICK_PARTITIONS_AHEAD,
+                                         months_back=months_back)
+        copied = conn.execute(text("""
+            INSERT INTO clicks (id, link_id, clicked_at, is_valid, rewarded)
+            SELECT id, link_id, COALESCE(clicked_at, now() AT TIME ZONE 'utc'), is_valid, rewarded
+            FROM clicks_unpartitioned
+        """)).rowcount
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('clicks', 'id'), "
+            "(SELECT COALESCE(max(id), 0) + 1 FROM clicks), false)"
+        ))
+        conn.execute(text("DROP TABLE clicks_unpartitioned"))
+
+    print(f"Copied {copied} clicks into the partitioned clicks table.")
+
+# Create the default partition and the monthly partitions up to months_ahead months from now
+def ensure(months_ahead):
+    with engine.begin() as conn:
+        created = partitions.ensure_partitions(conn, months_ahead=months_ahead)
+    print(f"Created partitions: {', '.join(created)}" if created else "All partitions exist.")
+
+def archive(keep_months, archive_dir):
+    archived = partitions.archive_partitions(engine, keep_months, archive_dir)
+    for path in archived:
+        print(f"Archived {path}")
+    if not archived:
+        print(f"No partitions older than {keep_months} months.")
+
+def show():
+    with engine.connect() as conn:
+        for start, name in sorted(partitions.list_partitions(conn).items()):
+            rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            print(f"{name}  {start:%Y-%m}  {rows} clicks")
+        if partitions.DEFAULT_PARTITION in inspect(conn).get_table_names():
+            rows = conn.execute(text(f"SELECT count(*) FROM {partitions.DEFAULT_PARTITION}")).scalar()
+            print(f"{partitions.DEFAULT_PARTITION}  other months  {rows} clicks")
+
+# Run "ensure" and "archive" daily (e.g. from cron) so inserts always find their partition
+# and old clicks leave the database
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the monthly partitions of the clicks table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="partition an existing clicks table")
+    ensure_parser = commands.add_parser("ensure", help="create upcoming monthly partitions")
+    ensure_parser.add_argument("--months-ahead", type=int, default=config.CLICK_PARTITIONS_AHEAD)
+    archive_parser = commands.add_parser("archive", help="archive and drop old partitions")
+    archive_parser.add_argument("--keep-months", type=int, default=config.CLICK_RETENTION_MONTHS)
+    archive_parser.add_argument("--archive-dir", default=config.CLICK_ARCHIVE_DIR)
+    commands.add_parser("list", help="show the partitions and their sizes")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    elif args.command == "ensure":
+        ensure(args.months_ahead)
+    elif args.command == "archive":
+        archive(args.keep_months, args.archive_dir)
+    else:
+        show()
@@ -0,0 +1,80 @@
+import argparse
+import glob
+import logging
+import os
+from sqlalchemy import inspect, text
+from database import engine, Session
+from spool import ClickSpool, RECORD_SIZE
+import partitions
+import config
+
+# Add clicks.event_id and its unique index to a database created before the click spool.
+# The index is built on each partition with CREATE INDEX CONCURRENTLY and then attached,
+# so redirects keep writing clicks meanwhile. Safe to run more than once.
+def migrate():
+    columns = [c['name'] for c in inspect(engine).get_columns('clicks')]
+    if 'event_id' not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE clicks ADD COLUMN event_id BYTEA"))
+        print("Added column clicks.event_id")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('uq_clicks_event_id')"
+        )).scalar()
+        if valid:
+            print("Index uq_clicks_event_id is in place.")
+            return
+
+        # Invalid until every partition has its index attached
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_clicks_event_id ON ONLY clicks (event_id, clicked_at)"
+        ))
+        names = sorted(partitions.list_partitions(conn).values())
+        if partitions.DEFAULT_PARTITION in inspect(conn).get_table_names():
+            names.append(partitions.DEFAULT_PARTITION)
+        for name in names:
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name}_event_id_key "
+                f"ON {name} (event_id, clicked_at)"
+            ))
+            attached = conn.execute(text("""
+                SELECT 1 FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE c.relname = :index
+            """), {"index": f"{name}_event_id_key"}).first()
+            if not attached:
+                conn.execute(text(f"ALTER INDEX uq_clicks_event_id ATTACH PARTITION {name}_event_id_key"))
+    print("Index uq_clicks_event_id is in place.")
+
+# Load the segments in directory, e.g. a spool copied from another host. Clicks that are
+# already in the database are skipped; the loaded ones wait for validate_pending.py.
+def replay(directory):
+    spool = ClickSpool(directory, Session, max_events=config.CLICK_FLUSH_MAX_EVENTS)
+    print(f"Loaded {spool.flush()} clicks from {directory}.")
+    status(directory)
+
+def status(directory):
+    segments = sorted(glob.glob(os.path.join(directory, "*.log")))
+    spooled = sum(os.path.getsize(path) for path in segments)
+    print(f"{len(segments)} segments, {spooled // RECORD_SIZE} clicks waiting in {directory}")
+    for path in sorted(glob.glob(os.path.join(directory, "*.rejected"))):
+        print(f"Rejected: {path}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the durable click spool")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="add the event id the spool needs to an existing clicks table")
+    replay_parser = commands.add_parser("replay", help="load spooled clicks into the database")
+    replay_parser.add_argument("--dir", default=config.CLICK_SPOOL_DIR)
+    status_parser = commands.add_parser("status", help="show the clicks waiting in the spool")
+    status_parser.add_argument("--dir", default=config.CLICK_SPOOL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    elif args.command == "replay":
+        replay(args.dir)
+    else:
+        status(args.dir)
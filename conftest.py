@@ -0,0 +1,20 @@
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "single_mode: run with the Flask client only, not also against async_app")
+
+
+class FakeClock:
+    """A clock for the components that take one; tests move it by setting now."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -1,8 +1,16 @@
 from sqlalchemy import inspect, text
 from database import engine
 from models import Base
+import argparse
+import catalog
 import os
 
+parser = argparse.ArgumentParser(description="Show the database connection, schemas and tables")
+parser.add_argument("--fast", action="store_true",
+                    help="estimate row counts from the statistics catalogs instead of counting "
+                         "(no full scans) and report table sizes, index usage and missing indexes")
+args = parser.parse_args()
+
 # Connection details
 print("Database URL:", engine.url)
 print("Working directory:", os.getcwd())
@@ -20,20 +28,38 @@ for schema in schemas:
 
 # Tables in default schema
 print(f"\nTables in schema '{schema_name}':")
-tables = inspector.get_table_names(schema=schema_name)
+# Partitions are counted with their parent table
+with engine.connect() as conn:
+    partitions = catalog.partitions_by_parent(conn)
+partition_names = {name for names in partitions.values() for name in names}
+tables = [table_name for table_name in inspector.get_table_names(schema=schema_name)
+          if table_name not in partition_names]
 for table_name in tables:
     print(f"- {table_name}")
+    if table_name in partitions:
+        print(f"  Partitions: {len(partitions[table_name])} ({partitions[table_name][0]} .. {partitions[table_name][-1]})")
     print("  Columns:")
     for column in inspector.get_columns(table_name, schema=schema_name):
         print(f"    - {column['name']} ({column['type']})")
 
 # Count rows in each table
-print("\nRow counts:")
-with engine.connect() as conn:
+if args.fast:
+    print("\nRow counts (estimated):")
+    with engine.connect() as conn:
+        estimates = catalog.approximate_counts(conn)
     for table_name in tables:
-        count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
-        print(f"- {table_name}: {count} rows")
+        print(f"- {table_name}: ~{estimates.get(table_name, 0)} rows")
+else:
+    print("\nRow counts:")
+    with engine.connect() as conn:
+        for table_name in tables:
+            count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            print(f"- {table_name}: {count} rows")
 
 print("\nExpected tables from models.py:")
 for cls in Base.__subclasses__():
-    print(f"- {cls.__tablename__}")
\ No newline at end of file
+    print(f"- {cls.__tablename__}")
+
+if args.fast:
+    with engine.connect() as conn:
+        catalog.print_report(conn)
@@ -0,0 +1,51 @@
+from sqlalchemy import inspect, text
+from database import engine
+
+# Merge duplicate (link_id, year_month) rows in monthly_stats and add the unique
+# constraint the counter upserts rely on. Safe to run more than once.
+def dedupe_monthly_stats():
+    constraints = inspect(engine).get_unique_constraints('monthly_stats')
+    if any(c['name'] == 'uq_monthly_stats_link_month' for c in constraints):
+        print("monthly_stats already has uq_monthly_stats_link_month, nothing to do.")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE monthly_stats IN SHARE ROW EXCLUSIVE MODE"))
+
+        # Fold every group of duplicates into its oldest row
+        merged = conn.execute(text("""
+            WITH totals AS (
+                SELECT MIN(id) AS keep_id,
+                       SUM(clicks) AS clicks,
+                       SUM(valid_clicks) AS valid_clicks,
+                       SUM(rewards_earned) AS rewards_earned
+                FROM monthly_stats
+                GROUP BY link_id, year_month
+                HAVING COUNT(*) > 1
+            )
+            UPDATE monthly_stats m
+            SET clicks = totals.clicks,
+                valid_clicks = totals.valid_clicks,
+                rewards_earned = totals.rewards_earned
+            FROM totals
+            WHERE m.id = totals.keep_id
+        """)).rowcount
+
+        deleted = conn.execute(text("""
+            DELETE FROM monthly_stats m
+            USING monthly_stats keep
+            WHERE m.link_id = keep.link_id
+              AND m.year_month = keep.year_month
+              AND m.id > keep.id
+        """)).rowcount
+
+        conn.execute(text(
+            "ALTER TABLE monthly_stats "
+            "ADD CONSTRAINT uq_monthly_stats_link_month UNIQUE (link_id, year_month)"
+        ))
+
+    print(f"Merged {merged} duplicated link/month groups, deleted {deleted} rows.")
+    print("Added constraint uq_monthly_stats_link_month.")
+
+if __name__ == "__main__":
+    dedupe_monthly_stats()
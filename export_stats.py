@@ -0,0 +1,33 @@
+import json
+import sys
+from sqlalchemy.orm import Session
+from database import engine, replica_engine
+from replica import ReplicaMonitor
+from stats import export_link_stats
+import config
+
+# The replica when one is configured, reachable and at most REPLICA_MAX_LAG seconds behind,
+# else the primary, as for GET /stats/export
+def export_engine():
+    if replica_engine is None:
+        return engine
+    monitor = ReplicaMonitor(replica_engine, max_lag=config.REPLICA_MAX_LAG)
+    monitor.check()
+    return replica_engine if monitor.stats()["available"] else engine
+
+# Write every link's totals and monthly earnings as NDJSON (one JSON object per line)
+def export_stats(out):
+    count = 0
+    with Session(export_engine()) as session:
+        for entry in export_link_stats(session, batch_size=config.EXPORT_BATCH_SIZE):
+            out.write(json.dumps(entry) + "\n")
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "w") as f:
+            count = export_stats(f)
+        print(f"Exported {count} links to {sys.argv[1]}")
+    else:
+        export_stats(sys.stdout)
@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import timezone
+
+
+# Seconds since the epoch; naive datetimes are UTC, like clicks.clicked_at
+def timestamp(clicked_at):
+    if clicked_at.tzinfo is None:
+        clicked_at = clicked_at.replace(tzinfo=timezone.utc)
+    return clicked_at.timestamp()
+
+
+class ClickRateScorer:
+    """Per-visitor and per-link click rates over a sliding window of click time,
+    computed for a whole batch of clicks at once.
+
+    Clicks are placed at their clicked_at, not at the time they are scored, so
+    a backlog validated late (validate_pending.py, a replayed spool) is measured
+    as the clicks happened. A click's rates count the clicks of its visitor, its
+    link and the pair in the window seconds up to its clicked_at, the batch
+    included. Clicks more than window seconds older than the oldest click of a
+    batch are forgotten, and at most max_tracked clicks are remembered. Clicks
+    without a fingerprint count towards their link only; clicks without a
+    clicked_at are placed at the time the batch is scored (clock(), a Unix time).
+    """
+
+    def __init__(self, window=60.0, max_tracked=1000000, clock=time.time):
+        self.window = window
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._recent = []  # heap of (clicked_at, sequence, fingerprint, link_id)
+        self._sequence = itertools.count()
+        # Sorted click times per visitor, link and visitor/link pair
+        self._visitors = {}
+        self._links = {}
+        self._pairs = {}
+
+    # Feature columns for the batch, one list per feature with one value per click: clicks
+    # per minute of the click's visitor, of its link, and of the visitor on that link
+    def features(self, batch):
+        now = self._clock()
+        times = [now if click.clicked_at is None else timestamp(click.clicked_at) for click in batch]
+        per_minute = 60.0 / self.window
+        visitor_rate, link_rate, visitor_link_rate = [], [], []
+
+        with self._lock:
+            if times:
+                self._expire(min(times) - self.window)
+            for at, click in zip(times, batch):
+                self._remember(at, click.fingerprint, click.link_id)
+            while len(self._recent) > self.max_tracked:
+                self._forget()
+
+            for at, click in zip(times, batch):
+                fingerprint, link_id = click.fingerprint, click.link_id
+                link_rate.append(self._count(self._links, link_id, at) * per_minute)
+                if fingerprint is None:
+                    visitor_rate.append(0.0)
+                    visitor_link_rate.append(0.0)
+                else:
+                    visitor_rate.append(self._count(self._visitors, fingerprint, at) * per_minute)
+                    visitor_link_rate.append(self._count(self._pairs, (fingerprint, link_id), at) * per_minute)
+
+        return {
+            "visitor_rate": visitor_rate,
+            "link_rate": link_rate,
+            "visitor_link_rate": visitor_link_rate,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            self._visitors.clear()
+            self._links.clear()
+            self._pairs.clear()
+
+    # Clicks of key in the window seconds up to at
+    def _count(self, index, key, at):
+        times = index.get(key)
+        if not times:
+            return 0
+        return bisect_right(times, at) - bisect_right(times, at - self.window)
+
+    def _remember(self, at, fingerprint, link_id):
+        heapq.heappush(self._recent, (at, next(self._sequence), fingerprint, link_id))
+        insort(self._links.setdefault(link_id, []), at)
+        if fingerprint is not None:
+            insort(self._visitors.setdefault(fingerprint, []), at)
+            insort(self._pairs.setdefault((fingerprint, link_id), []), at)
+
+    def _expire(self, before):
+        while self._recent and self._recent[0][0] <= before:
+            self._forget()
+
+    # Drop the oldest click, which is also the oldest of each of its keys
+    def _forget(self):
+        _, _, fingerprint, link_id = heapq.heappop(self._recent)
+        keys = [(self._links, link_id)]
+        if fingerprint is not None:
+            keys += [(self._visitors, fingerprint), (self._pairs, (fingerprint, link_id))]
+        for index, key in keys:
+            times = index[key]
+            del times[0]
+            if not times:
+                del index[key]
+
+
+# Clicks whose visitor exceeds either rate are rejected outright (bots, click farms)
+def rate_rules(features, max_visitor_rate, max_visitor_link_rate):
+    return [
+        visitor <= max_visitor_rate and repeat <= max_visitor_link_rate
+        for visitor, repeat in zip(features["visitor_rate"], features["visitor_link_rate"])
+    ]
@@ -0,0 +1,108 @@
+import heapq
+import math
+import threading
+import time
+from operator import itemgetter
+
+# Forward-decayed weights grow exponentially with time; past this factor the counters
+# are scaled back down so they stay far from float overflow
+RESCALE_AT = 1e12
+
+
+class HeavyHitters:
+    """The most frequent keys of a stream in fixed memory (space-saving algorithm).
+
+    At most capacity keys are counted. A key that is not counted yet takes over
+    the smallest counter, inheriting its count as the error bound, so every
+    key whose share of the stream is above 1/capacity is guaranteed a counter.
+    Counts decay with the given half-life, which makes them proportional to
+    each key's recent rate; a click adds exp(decay * t) instead of shrinking
+    every counter over time (forward decay).
+
+    Every refresh_interval seconds on_refresh(tracker) is called from add(),
+    outside the lock, e.g. to pin the current top keys in a cache.
+    """
+
+    def __init__(self, capacity=1000, half_life=60.0, on_refresh=None, refresh_interval=5.0,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.on_refresh = on_refresh
+        self.refresh_interval = refresh_interval
+        self._decay = math.log(2) / half_life
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._next_refresh = self._start + refresh_interval
+        self._counts = {}  # key -> decayed count, in units of exp(decay * (t - start))
+        self._errors = {}  # key -> overestimation bound, same units
+        self._heap = []  # (count, key), with stale entries skipped lazily
+
+    def add(self, key):
+        with self._lock:
+            now = self._clock()
+            weight = math.exp(self._decay * (now - self._start))
+            if weight > RESCALE_AT:
+                self._rescale(now)
+                weight = 1.0
+
+            count = self._counts.get(key)
+            if count is None:
+                floor = 0.0
+                if len(self._counts) >= self.capacity:
+                    floor, evicted = self._pop_min()
+                    del self._counts[evicted]
+                    del self._errors[evicted]
+                count = floor
+                self._errors[key] = floor
+            count += weight
+            self._counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+            if len(self._heap) > 4 * self.capacity:
+                self._heapify()
+
+            refresh = self.on_refresh is not None and now >= self._next_refresh
+            if refresh:
+                self._next_refresh = now + self.refresh_interval
+        if refresh:
+            self.on_refresh(self)
+
+    # The n keys with the highest recent rate as (key, per minute, error per minute), highest
+    # first. The true rate lies between the estimate minus the error and the estimate.
+    def top(self, n):
+        with self._lock:
+            scale = math.exp(-self._decay * (self._clock() - self._start)) * self._decay * 60
+            return [
+                (key, count * scale, self._errors[key] * scale)
+                for key, count in heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._errors.clear()
+            self._heap = []
+
+    def stats(self):
+        with self._lock:
+            return {"tracked": len(self._counts), "capacity": self.capacity}
+
+    # Smallest current counter; heap entries whose count changed since are stale
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                return count, key
+
+    def _heapify(self):
+        self._heap = [(count, key) for key, count in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    # Express every counter relative to now instead of the old start
+    def _rescale(self, now):
+        factor = math.exp(-self._decay * (now - self._start))
+        for key in self._counts:
+            self._counts[key] *= factor
+            self._errors[key] *= factor
+        self._start = now
+        self._heapify()
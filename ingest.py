@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import insert
+
+from models import Click
+from stats import increment_monthly_stats
+
+log = logging.getLogger(__name__)
+
+
+class ClickBuffer:
+    """Accumulates clicks in memory and writes them to the database in bulk.
+
+    Every flush_interval seconds, or as soon as max_events clicks are waiting,
+    the buffered clicks are written with one multi-row INSERT and the click
+    counts, merged per (link_id, year_month), are added to monthly_stats with
+    one upsert in the same transaction. on_flush receives the inserted
+    (id, link_id, clicked_at, fingerprint) rows after the commit, e.g. to
+    queue them for fraud validation. The visitor fingerprint is not stored.
+    """
+
+    def __init__(self, session_factory, on_flush=None, flush_interval=0.1, max_events=1000,
+                 max_buffered=100000):
+        self.session_factory = session_factory
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.max_buffered = max_buffered
+        self._events = []  # (link_id, clicked_at, fingerprint)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._thread = None
+        self._pid = None
+        self._counters = {
+            "buffered": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+        }
+        self._last_flush_ms = 0.0
+
+    # Start the background flusher (again after a fork, threads do not survive it)
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+            self._thread.start()
+
+    # Record a click; it reaches the database with the next flush
+    def add(self, link_id, clicked_at, fingerprint=None):
+        self.start()
+        with self._lock:
+            if len(self._events) >= self.max_buffered:
+                self._counters["dropped"] += 1
+                log.error("Click buffer full, dropping click for link %s", link_id)
+                return False
+            self._events.append((link_id, clicked_at, fingerprint))
+            self._counters["buffered"] += 1
+            full = len(self._events) >= self.max_events
+        if full:
+            self._wakeup.set()
+        return True
+
+    # Write everything buffered so far; returns the number of clicks written
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                rows = self._write(events)
+            except Exception:
+                # Keep the clicks for the next attempt
+                with self._lock:
+                    self._events[:0] = events
+                    self._counters["failed_flushes"] += 1
+                log.exception("Failed to flush %d clicks", len(events))
+                return 0
+
+            with self._lock:
+                self._counters["flushed"] += len(events)
+                self._counters["flushes"] += 1
+                self._last_flush_ms = (time.perf_counter() - started) * 1000
+
+        if self.on_flush:
+            self.on_flush(rows)
+        return len(rows)
+
+    # Stop the flusher and write whatever is left
+    def close(self):
+        with self._lock:
+            self._closing = True
+            thread, self._thread = self._thread, None
+            self._pid = None
+        self._wakeup.set()
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = len(self._events)
+            stats["last_flush_ms"] = round(self._last_flush_ms, 3)
+        return stats
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closing:
+                return
+            self.flush()
+
+    def _write(self, events):
+        session = self.session_factory()
+        try:
+            # Rows come back in event order, so each can be matched with its fingerprint
+            rows = session.execute(
+                insert(Click).returning(Click.id, Click.link_id, Click.clicked_at, sort_by_parameter_order=True),
+                [{"link_id": link_id, "clicked_at": clicked_at} for link_id, clicked_at, _ in events]
+            ).all()
+
+            increment_monthly_stats(
+                session,
+                ((link_id, clicked_at.strftime('%Y-%m'), 1, 0, 0.0) for link_id, clicked_at, _ in events)
+            )
+
+            session.commit()
+            return [tuple(row) + (fingerprint,) for row, (_, _, fingerprint) in zip(rows, events)]
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,96 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import Link
+
+# Columns returned for every resolved link
+LINK_COLUMNS = (Link.id, Link.seller_id, Link.original_url, Link.short_code, Link.created_at)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+# Canonical form of a URL for duplicate detection: surrounding whitespace removed, scheme
+# and host lower-cased, default port dropped and an empty path written as "/".
+# Path, query and fragment are case-sensitive and kept as they are.
+def normalize_url(url):
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname
+    if ':' in netloc:
+        netloc = f"[{netloc}]"  # IPv6 literal
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+# Compact fixed-size fingerprint of a URL stored in links.url_hash (16 bytes)
+def url_hash(url):
+    return hashlib.blake2b(normalize_url(url).encode(), digest_size=16).digest()
+
+
+# Resolve (seller_id, target_url) pairs to links, creating the missing ones, with a fixed
+# number of statements whatever the number of pairs: one lookup of the existing links on
+# (seller_id, url_hash), the short code reservations and one multi-row INSERT. Pairs that
+# normalize to the same URL share one link, reported as created only the first time.
+# Returns (row, created) for every pair, in input order; the caller commits.
+def get_or_create_links(session, allocator, pairs):
+    keyed = [((seller_id, url_hash(target_url)), target_url) for seller_id, target_url in pairs]
+    first_urls = {}
+    for key, target_url in keyed:
+        first_urls.setdefault(key, target_url)
+    if not first_urls:
+        return []
+
+    existing = _find_links(session, list(first_urls))
+
+    missing = [key for key in first_urls if key not in existing]
+    created = {}
+    if missing:
+        short_codes = allocator.allocate_many(session, len(missing))
+        stmt = insert(Link).values([
+            {
+                "seller_id": seller_id,
+                "original_url": first_urls[(seller_id, digest)],
+                "url_hash": digest,
+                "short_code": short_code,
+            }
+            for (seller_id, digest), short_code in zip(missing, short_codes)
+        ])
+        # A concurrent request may have created some of them in the meantime; keep theirs
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Link.seller_id, Link.url_hash])
+        created = {(row.seller_id, row.url_hash): row
+                   for row in session.execute(stmt.returning(*LINK_COLUMNS, Link.url_hash))}
+        lost = [key for key in missing if key not in created]
+        if lost:
+            existing.update(_find_links(session, lost))
+
+    results = []
+    for key, _ in keyed:
+        if key in created:
+            # Only the first occurrence counts as created, repeats reuse it
+            results.append((created.pop(key), True))
+            existing[key] = results[-1][0]
+        else:
+            results.append((existing[key], False))
+    return results
+
+
+def _find_links(session, keys):
+    rows = session.execute(
+        select(*LINK_COLUMNS, Link.url_hash).where(tuple_(Link.seller_id, Link.url_hash).in_(keys))
+    )
+    return {(row.seller_id, row.url_hash): row for row in rows}
@@ -0,0 +1,260 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from a cached redirect to a slow export
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements per request
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per combination of label values."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for label_values, values in series:
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                bucket_labels = ",".join(labels + ['le="%s"' % bound])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{%s}" % ",".join(labels) if labels else ""
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+            lines.append(f"{self.name}_sum{suffix} {round(values[-1], 6)}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Keys of the components' stats() dicts that count events since the process started, with
+# their help text. They are exported as counters named prefix_key_total, so rate() and
+# increase() work on them across restarts.
+COUNTERS = {
+    # Fraud validation
+    "submitted": "Clicks submitted for fraud validation",
+    "rejected": "Clicks not queued for validation because the queue was full",
+    "validated": "Clicks given a verdict",
+    "valid": "Clicks found valid",
+    "retried": "Validator calls retried after an error",
+    "failed": "Clicks whose validation failed after every retry",
+    "repeats": "Repeat clicks answered from the verdict cache",
+    "screened_out": "Clicks rejected by the rate rules without calling the validator",
+    "validation_seconds_saved": "Validator time saved by the verdict cache, in seconds",
+    # Caches
+    "hits": "Lookups answered from the cache",
+    "misses": "Lookups not in the cache",
+    "negative_hits": "Lookups answered from a cached unknown short code",
+    "pinned_hits": "Lookups answered from a pinned hot link",
+    "evictions": "Entries evicted to stay within max_size",
+    "expirations": "Entries dropped after their time to live",
+    "invalidations": "Entries dropped because the data behind them changed",
+    # Click buffer and spool
+    "buffered": "Clicks accepted by the click buffer",
+    "flushed": "Clicks written to the database",
+    "flushes": "Flushes that wrote clicks",
+    "failed_flushes": "Flushes that failed and kept their clicks for the next attempt",
+    "dropped": "Clicks dropped because they could not be buffered",
+    "loaded_segments": "Spool segments loaded into the database",
+    "rejected_clicks": "Spooled clicks the database refused, set aside in .rejected files",
+    # Connection pools
+    "checkouts": "Connections checked out of the pool",
+    "waits": "Checkouts that waited for a free connection",
+    "wait_ms_total": "Time spent waiting for a free connection, in milliseconds",
+    "overflow_events": "Connections opened beyond pool_size",
+    "timeouts": "Checkouts that gave up waiting for a connection",
+    # Read replica
+    "checks": "Replica lag checks",
+    "failed_checks": "Replica lag checks that could not reach the replica",
+    "lagging_checks": "Replica lag checks that found it more than max_lag behind",
+    "failed_reads": "Reads that failed on the replica and ran again on the primary",
+    "replica_reads": "Reads sent to the replica",
+    "primary_reads": "Reads sent to the primary",
+}
+
+# Help text of the keys that are a current level or a setting, exported as gauges
+GAUGES = {
+    "verdict_cache_hit_rate": "Share of verdict cache lookups that were hits",
+    "backlog": "Clicks waiting in the validation queue",
+    "in_flight": "Clicks being validated right now",
+    "capacity": "Maximum number of entries the component holds",
+    "workers": "Worker threads",
+    "size": "Entries in the cache",
+    "max_size": "Maximum number of entries in the cache",
+    "hit_rate": "Share of lookups answered from the cache",
+    "pinned": "Hot links pinned in the cache",
+    "tracked": "Links tracked by the hot link sketch",
+    "pending": "Clicks waiting to be written to the database",
+    "last_flush_ms": "Duration of the last flush, in milliseconds",
+    "spooled_bytes": "Bytes of clicks waiting in spool segments",
+    "pool_size": "Connections the pool keeps open",
+    "checked_out": "Connections in use",
+    "checked_in": "Idle connections in the pool",
+    "overflow": "Connections open beyond pool_size",
+    "max_overflow": "Maximum number of connections beyond pool_size",
+    "wait_ms_max": "Longest wait for a free connection, in milliseconds",
+    "available": "1 when reads may go to the replica",
+    "lag_seconds": "Replica replay lag at the last check, in seconds",
+    "max_lag_seconds": "Replay lag above which reads go to the primary, in seconds",
+}
+
+
+# Numeric entries of a component's stats() dict: counters named prefix_key_total, the rest
+# gauges named prefix_key
+def render_stats(prefix, stats):
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue  # e.g. no lag measured yet
+        if key in COUNTERS:
+            name, kind, help = f"{prefix}_{key}_total", "counter", COUNTERS[key]
+        else:
+            help = GAUGES.get(key, key.replace("_", " ").capitalize())
+            name, kind = f"{prefix}_{key}", "gauge"
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return lines
+
+
+request_seconds = Histogram(
+    "fiverr_request_seconds", "Time to produce a response, by route",
+    labels=("method", "route", "status")
+)
+request_queries = Histogram(
+    "fiverr_request_queries", "SQL statements executed per request, by route",
+    labels=("method", "route"), buckets=QUERY_BUCKETS
+)
+request_query_seconds = Histogram(
+    "fiverr_request_query_seconds", "Time spent in SQL statements per request, by route",
+    labels=("method", "route")
+)
+validation_seconds = Histogram(
+    "fiverr_validation_seconds", "Time taken by a fraud validator call, by outcome",
+    labels=("outcome",)
+)
+validation_batch_size = Histogram(
+    "fiverr_validation_batch_size", "Clicks per fraud validator call",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+
+HISTOGRAMS = (request_seconds, request_queries, request_query_seconds, validation_seconds, validation_batch_size)
+
+
+# Prometheus text exposition of the histograms plus the components' stats: {prefix: stats dict}
+def render(components):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for prefix, stats in components.items():
+        lines.extend(render_stats(prefix, stats))
+    return "\n".join(lines) + "\n"
+
+
+# Record a validator call; verdicts is None when it raised
+def observe_validation(seconds, verdicts):
+    validation_seconds.observe(seconds, "error" if verdicts is None else "ok")
+    if verdicts is not None:
+        validation_batch_size.observe(len(verdicts))
+
+
+class RequestTrace:
+    """The SQL statements executed while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []  # (statement, seconds)
+
+    @property
+    def query_seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+
+# The trace of the request being served; a context variable so it follows the request
+# across threads (Flask) and tasks (Quart)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_request():
+    return current_trace.set(RequestTrace())
+
+
+# Record a finished request; slow_ms > 0 logs requests slower than that with their statements
+def finish_request(token, method, route, status, slow_ms=0):
+    trace = current_trace.get()
+    current_trace.reset(token)
+    if trace is None:
+        return
+    elapsed = time.perf_counter() - trace.started
+    request_seconds.observe(elapsed, method, route, str(status))
+    request_queries.observe(len(trace.statements), method, route)
+    request_query_seconds.observe(trace.query_seconds, method, route)
+
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        breakdown = "".join(
+            f"\n  {seconds * 1000:8.2f} ms  {' '.join(statement.split())[:200]}"
+            for statement, seconds in trace.statements
+        )
+        log.warning(
+            "Slow request %s %s -> %s: %.1f ms, %d statements in %.1f ms%s",
+            method, route, status, elapsed * 1000, len(trace.statements), trace.query_seconds * 1000, breakdown
+        )
+
+
+# Time every statement run on engine and add it to the current request's trace
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        trace = current_trace.get()
+        if trace is not None:
+            trace.statements.append((statement, time.perf_counter() - started))
+
+    # A failed statement never reaches after_cursor_execute
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None:
+            started = context.connection.info.get("metrics_started")
+            if started:
+                started.pop()
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Float, DateTime, ForeignKey, func
+from sqlalchemy import event, Column, Integer, String, Text, Boolean, Float, DateTime, ForeignKey, LargeBinary, Index, Sequence, UniqueConstraint, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+import partitions
 
 Base = declarative_base()
 
+# Timestamps are stored as naive UTC in "timestamp without time zone" columns
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Source of unique numbers for SequenceCodeAllocator (shortcodes.py)
+short_code_seq = Sequence('short_code_seq', metadata=Base.metadata)
+
 class Link(Base):
     __tablename__ = 'links'
 
@@ -12,12 +20,22 @@ class Link(Base):
     original_url = Column(Text, nullable=False)
     short_code = Column(String(10), unique=True, nullable=False)
     seller_id = Column(String(50), nullable=False)  # In a real system, would be Foreign Key
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    url_hash = Column(LargeBinary(16))  # 128-bit hash of the normalized URL, see links.url_hash()
+    created_at = Column(DateTime, default=utcnow)
 
     # Relationships
     clicks = relationship("Click", back_populates="link")
     monthly_stats = relationship("MonthlyStat", back_populates="link")
 
+    __table_args__ = (
+        # Newest-first ordering and keyset pagination of /stats
+        Index('ix_links_created_at_id', 'created_at', 'id'),
+        # Duplicate detection: one link per seller and normalized URL
+        Index('uq_links_seller_url_hash', 'seller_id', 'url_hash', unique=True),
+        # A seller's links, newest first (/sellers/<seller_id>/stats)
+        Index('ix_links_seller_created_at_id', 'seller_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f"<Link(id={self.id}, short_code={self.short_code})>"
 
@@ -25,11 +43,25 @@ class Link(Base):
 class Click(Base):
     __tablename__ = 'clicks'
 
-    id = Column(Integer, primary_key=True)
+    # Partitioned by month of clicked_at (see partitions.py); the partition key has to be
+    # part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
     link_id = Column(Integer, ForeignKey('links.id'), nullable=False)
-    clicked_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    is_valid = Column(Boolean, default=False)  # Determined by fraud validation
+    clicked_at = Column(DateTime, primary_key=True, default=utcnow)
+    is_valid = Column(Boolean, nullable=True)  # Fraud verdict; NULL while validation is pending
     rewarded = Column(Boolean, default=False)  # Whether the reward was processed
+    event_id = Column(LargeBinary(16))  # Random id given by the click spool (spool.py); NULL otherwise
+
+    __table_args__ = (
+        # Per-link and per-period queries (fraud review, audits, rebuilding monthly_stats)
+        Index('ix_clicks_link_clicked_at', 'link_id', 'clicked_at'),
+        # Small partial index used to find clicks still waiting for validation
+        Index('ix_clicks_pending', 'id', postgresql_where=is_valid.is_(None)),
+        # Replaying a spool segment skips the clicks it already loaded; unique indexes of a
+        # partitioned table have to include the partition key
+        Index('uq_clicks_event_id', 'event_id', 'clicked_at', unique=True),
+        {'postgresql_partition_by': 'RANGE (clicked_at)'},
+    )
 
     # Relationships
     link = relationship("Link", back_populates="clicks")
@@ -38,6 +70,15 @@ class Click(Base):
         return f"<Click(id={self.id}, link_id={self.link_id}, valid={self.is_valid})>"
 
 
+# A new clicks table gets its default partition and the monthly partitions around now.
+# config is read here, not when models is imported: scripts such as benchmarks/bench_load.py
+# import the models first and set DATABASE_URL afterwards.
+@event.listens_for(Click.__table__, 'after_create')
+def create_click_partitions(target, connection, **kw):
+    import config
+    partitions.ensure_partitions(connection, months_ahead=config.CLICK_PARTITIONS_AHEAD)
+
+
 class MonthlyStat(Base):
     __tablename__ = 'monthly_stats'
 
@@ -48,8 +89,33 @@ class MonthlyStat(Base):
     valid_clicks = Column(Integer, default=0)
     rewards_earned = Column(Float, default=0.0)
 
+    __table_args__ = (
+        # One row per link and month; the target of the counter upserts
+        UniqueConstraint('link_id', 'year_month', name='uq_monthly_stats_link_month'),
+    )
+
     # Relationships
     link = relationship("Link", back_populates="monthly_stats")
 
     def __repr__(self):
-        return f"<MonthlyStat(link_id={self.link_id}, year_month={self.year_month})>"
\ No newline at end of file
+        return f"<MonthlyStat(link_id={self.link_id}, year_month={self.year_month})>"
+
+
+class SellerMonthlyStat(Base):
+    __tablename__ = 'seller_monthly_stats'
+
+    # Rollup of monthly_stats per seller, kept up to date by stats.increment_monthly_stats
+    id = Column(Integer, primary_key=True)
+    seller_id = Column(String(50), nullable=False)
+    year_month = Column(String(7), nullable=False)  # Format: YYYY-MM
+    clicks = Column(Integer, default=0)
+    valid_clicks = Column(Integer, default=0)
+    rewards_earned = Column(Float, default=0.0)
+
+    __table_args__ = (
+        # One row per seller and month; the target of the counter upserts
+        UniqueConstraint('seller_id', 'year_month', name='uq_seller_monthly_stats_seller_month'),
+    )
+
+    def __repr__(self):
+        return f"<SellerMonthlyStat(seller_id={self.seller_id}, year_month={self.year_month})>"
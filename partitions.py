@@ -0,0 +1,146 @@
+import gzip
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+# clicks is range-partitioned by clicked_at, one partition per calendar month
+# (clicks_YYYY_MM), plus clicks_default for rows outside every monthly partition.
+PARENT = "clicks"
+DEFAULT_PARTITION = "clicks_default"
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def add_months(start, months):
+    return month_start(start.year, start.month + months)
+
+
+def partition_name(start):
+    return f"{PARENT}_{start.year:04d}_{start.month:02d}"
+
+
+# Monthly partitions as {month start: name}
+def list_partitions(conn):
+    rows = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :parent
+    """), {"parent": PARENT}).scalars()
+    partitions = {}
+    for name in rows:
+        if name == DEFAULT_PARTITION:
+            continue
+        year, month = name[len(PARENT) + 1:].split("_")
+        partitions[datetime(int(year), int(month), 1)] = name
+    return partitions
+
+
+# Create the monthly partition starting at start. Clicks of that month that were
+# routed to the default partition meanwhile are moved into it.
+def create_partition(conn, start):
+    name = partition_name(start)
+    end = add_months(start, 1)
+    bounds = {"start": start, "end": end}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE clicked_at >= :start AND clicked_at < :end
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds).rowcount
+    # A CHECK matching the bounds lets ATTACH skip scanning the new partition
+    conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+        f"CHECK (clicked_at >= '{start.isoformat()}' AND clicked_at < '{end.isoformat()}')"
+    ))
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    if moved:
+        log.info("Moved %s clicks from %s to %s", moved, DEFAULT_PARTITION, name)
+    return name
+
+
+# Make sure the default partition and the monthly partitions from months_back months
+# ago to months_ahead months from now exist; returns the names of the new ones
+def ensure_partitions(conn, months_ahead=3, months_back=0, now=None):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    now = now or utcnow()
+    current = month_start(now.year, now.month)
+    existing = list_partitions(conn)
+    created = []
+    for offset in range(-months_back, months_ahead + 1):
+        start = add_months(current, offset)
+        if start not in existing:
+            created.append(create_partition(conn, start))
+    return created
+
+
+# Monthly partition tables that were detached but not archived yet (an interrupted archive run)
+def list_detached(conn):
+    rows = conn.execute(text("""
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND relname ~ :pattern
+    """), {"pattern": f"^{PARENT}_[0-9]{{4}}_[0-9]{{2}}$"}).scalars()
+    return {datetime(int(name[-7:-3]), int(name[-2:]), 1): name for name in rows}
+
+
+# Detach every monthly partition that ended more than keep_months months ago, write its
+# rows to archive_dir as gzipped CSV and drop it. Partitions that still hold clicks waiting
+# for validation are kept. Returns the paths of the written archives.
+def archive_partitions(engine, keep_months, archive_dir, now=None):
+    now = now or utcnow()
+    cutoff = add_months(month_start(now.year, now.month), -keep_months)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    with engine.connect() as conn:
+        expired = sorted((start, name) for start, name in list_partitions(conn).items() if start < cutoff)
+        leftovers = sorted(list_detached(conn).items())
+
+    # Detach in short transactions of their own: DETACH locks the whole clicks table until
+    # the transaction ends, and the copy below can take a while
+    detached = []
+    for start, name in expired:
+        with engine.begin() as conn:
+            pending = conn.execute(text(f"SELECT count(*) FROM {name} WHERE is_valid IS NULL")).scalar()
+            if pending:
+                log.warning("Keeping %s: %s clicks are still waiting for validation", name, pending)
+                continue
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        detached.append((start, name))
+
+    archived = []
+    for start, name in sorted(leftovers + detached):
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        with engine.begin() as conn:
+            rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+
+            # Write to a temporary file first so an interrupted run never leaves a
+            # truncated archive under the final name
+            with gzip.open(path + ".tmp", "wb") as out:
+                cursor = conn.connection.driver_connection.cursor()
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+                cursor.close()
+            os.replace(path + ".tmp", path)
+
+            conn.execute(text(f"DROP TABLE {name}"))
+        log.info("Archived %s clicks of %s to %s", rows, name, path)
+        archived.append(path)
+    return archived
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+# Seconds of WAL replay the replica is behind the primary: 0 when it has replayed everything
+# it received (an idle primary sends nothing new) or is not a standby at all
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaMonitor:
+    """Decides whether the read replica may serve reads: it must be reachable and
+    at most max_lag seconds behind the primary.
+
+    A background thread measures the replica's replay lag every check_interval
+    seconds, so readers only look at a flag. A reader whose query fails on the
+    replica calls failed(), which sends reads to the primary until the next
+    successful check.
+    """
+
+    def __init__(self, engine, max_lag=5.0, check_interval=1.0):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._available = False
+        self._lag = None
+        self._counters = {
+            "checks": 0,
+            "failed_checks": 0,
+            "lagging_checks": 0,
+            "failed_reads": 0,
+            "replica_reads": 0,
+            "primary_reads": 0,
+        }
+
+    # Start the background checker (again after a fork, threads do not survive it)
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._available = False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # True when this read may go to the replica; counts the decision
+    def use_replica(self):
+        self.start()
+        with self._lock:
+            available = self._available
+            self._counters["replica_reads" if available else "primary_reads"] += 1
+        return available
+
+    # A query on the replica failed: read from the primary until the replica is healthy again
+    def failed(self):
+        with self._lock:
+            self._available = False
+            self._counters["failed_reads"] += 1
+
+    # Measure the replica's lag once; returns it in seconds, or None when it is unreachable
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                lag = float(conn.execute(LAG_QUERY).scalar())
+        except Exception:
+            log.warning("Read replica unavailable", exc_info=True)
+            lag = None
+        with self._lock:
+            self._counters["checks"] += 1
+            if lag is None:
+                self._counters["failed_checks"] += 1
+            elif lag > self.max_lag:
+                self._counters["lagging_checks"] += 1
+            self._lag = lag
+            self._available = lag is not None and lag <= self.max_lag
+        return lag
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["available"] = self._available
+            stats["lag_seconds"] = self._lag
+        stats["max_lag_seconds"] = self.max_lag
+        return stats
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stop.wait(self.check_interval):
+                return
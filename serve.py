@@ -0,0 +1,123 @@
+"""Production server: app.py on gunicorn, with worker processes that prewarm their link cache.
+
+The master loads the application once and forks the workers, which share its memory pages.
+Each worker serves requests on a pool of SERVER_THREADS threads, opens its own database
+connections (after the fork, never inherited from the master) and prewarms its link cache
+with the most clicked links before it accepts connections. A worker that dies is replaced.
+
+SIGTERM or SIGINT stops the server gracefully: workers stop accepting connections, finish
+the requests in flight, flush buffered clicks and validate them, then exit. Workers still
+running after SERVER_GRACEFUL_TIMEOUT seconds are killed.
+
+    python serve.py --workers 4 --port 5000
+"""
+import argparse
+import atexit
+import logging
+import os
+import signal
+
+from gunicorn.app.base import BaseApplication
+
+import config
+
+log = logging.getLogger("serve")
+
+
+# Until gunicorn installs the worker's own handlers, a SIGTERM reaches the handler copied
+# from the master, which only queues it for a master loop that does not run in the worker
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+# In the worker, right after the fork
+def post_fork(server, worker):
+    from database import engine, replica_engine
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    # Connections belong to the process that opened them; drop any pool state copied from
+    # the master without closing its sockets
+    engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
+
+
+# In the worker, before it accepts connections
+def post_worker_init(worker):
+    import app
+
+    try:
+        warmed = app.prewarm_link_cache()
+        log.info("Worker %d (pid %d) prewarmed %d links", worker.age, os.getpid(), warmed)
+    except Exception:
+        # A cold cache is slower, not broken
+        log.exception("Worker %d could not prewarm the link cache", worker.age)
+    if _stop_requested:
+        # Stopped while booting: exit through the normal drain instead of serving
+        worker.alive = False
+
+
+# In the worker, once it has drained its requests
+def worker_exit(server, worker):
+    import app
+    app.shutdown()
+
+
+def on_exit(server):
+    log.info("Server stopped")
+
+
+class Server(BaseApplication):
+    """Runs app.py on gunicorn with the given settings instead of a configuration file."""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    # Called once in the master (preload_app), before the workers are forked
+    def load(self):
+        import app
+        # Importing it does not connect to the database. app.shutdown() runs in worker_exit
+        # instead of atexit: the master serves no requests and must not flush or validate
+        # clicks, spooled segments included, that belong to the workers.
+        atexit.unregister(app.shutdown)
+        return app.app
+
+
+def options(host, port, workers):
+    return {
+        "bind": f"[{host}]:{port}" if ":" in host else f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "gthread",
+        "threads": config.SERVER_THREADS,
+        "backlog": config.SERVER_BACKLOG,
+        "keepalive": int(config.SERVER_KEEPALIVE_TIMEOUT),
+        "graceful_timeout": int(config.SERVER_GRACEFUL_TIMEOUT),
+        "preload_app": True,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "on_exit": on_exit,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Serve the API with several worker processes")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    args = parser.parse_args()
+
+    log.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    Server(options(args.host, args.port, args.workers)).run()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import string
+import threading
+
+from sqlalchemy import text
+
+from models import Link
+
+# Same alphabet as the random codes: 62 characters
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+
+
+# Fixed-width base62 encoding of 0 <= number < 62**length
+def encode_base62(number, length):
+    chars = []
+    for _ in range(length):
+        number, digit = divmod(number, BASE)
+        chars.append(ALPHABET[digit])
+    if number:
+        raise ValueError("Number does not fit in a short code of this length")
+    return ''.join(reversed(chars))
+
+
+def decode_base62(code):
+    number = 0
+    for char in code:
+        number = number * BASE + ALPHABET.index(char)
+    return number
+
+
+class Permutation:
+    """Keyed, reversible shuffle of the integers 0 .. 62**length - 1.
+
+    A balanced Feistel network over the smallest even number of bits that
+    covers the range, with cycle walking to stay inside it. Consecutive
+    inputs give unrelated-looking outputs, and distinct inputs always give
+    distinct outputs.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, key, length):
+        self.size = BASE ** length
+        bits = (self.size - 1).bit_length()
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        key = key.encode() if isinstance(key, str) else key
+        self.key = hashlib.blake2b(key).digest()  # any key length -> 64 bytes
+
+    def forward(self, number):
+        if not 0 <= number < self.size:
+            raise ValueError("Number outside the permutation domain")
+        while True:
+            number = self._feistel(number, range(self.ROUNDS))
+            if number < self.size:
+                return number
+
+    def inverse(self, number):
+        while True:
+            number = self._feistel_inverse(number, reversed(range(self.ROUNDS)))
+            if number < self.size:
+                return number
+
+    def _round(self, round_number, value):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, 'big'), digest_size=8, key=self.key, salt=bytes([round_number]) * 16
+        ).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _feistel(self, number, rounds):
+        left, right = number >> self.half_bits, number & self.mask
+        for r in rounds:
+            left, right = right, left ^ self._round(r, right)
+        return (left << self.half_bits) | right
+
+    def _feistel_inverse(self, number, rounds):
+        left, right = number >> self.half_bits, number & self.mask
+        for r in rounds:
+            left, right = right ^ self._round(r, left), left
+        return (left << self.half_bits) | right
+
+
+class RandomCodeAllocator:
+    """Random codes, checked against the links table until an unused one is found."""
+
+    def __init__(self, generator, max_attempts=100):
+        self.generator = generator
+        self.max_attempts = max_attempts
+
+    def allocate(self, session):
+        for _ in range(self.max_attempts):
+            short_code = self.generator()
+            if not session.query(Link.id).filter_by(short_code=short_code).first():
+                return short_code
+        raise RuntimeError("Could not find an unused short code")
+
+    def allocate_many(self, session, count):
+        return [self.allocate(session) for _ in range(count)]
+
+    def reset(self):
+        pass
+
+
+class SequenceCodeAllocator:
+    """Unique codes without existence checks: permuted values of a database sequence.
+
+    Sequence values are reserved in blocks of block_size per process, so most
+    allocations do not touch the database at all. The key must never change
+    once codes have been handed out, or new codes may repeat old ones.
+    """
+
+    def __init__(self, key, length=6, block_size=100, sequence='short_code_seq'):
+        self.length = length
+        self.block_size = block_size
+        self.sequence = sequence
+        self.permutation = Permutation(key, length)
+        self._block = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def allocate(self, session):
+        return self.allocate_many(session, 1)[0]
+
+    def allocate_many(self, session, count):
+        with self._lock:
+            # A forked worker must not reuse the values reserved by its parent
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._block = []
+            numbers = self._take(count)
+
+        # Reserve outside the lock: under asyncio the round trip lets other requests run
+        # on the same thread, and they must not block on a lock held across it
+        if numbers is None:
+            reserved = self._reserve(session, max(self.block_size, count))
+            with self._lock:
+                self._block.extend(reserved)
+                numbers = self._take(count)
+        return [self.encode(number) for number in numbers]
+
+    def _take(self, count):
+        if len(self._block) < count:
+            return None
+        numbers, self._block = self._block[:count], self._block[count:]
+        return numbers
+
+    # Forget reserved values, e.g. after the sequence was recreated
+    def reset(self):
+        with self._lock:
+            self._block = []
+
+    def encode(self, number):
+        if number >= self.permutation.size:
+            raise RuntimeError("Short code space exhausted, increase SHORT_CODE_LENGTH")
+        return encode_base62(self.permutation.forward(number), self.length)
+
+    # Sequence value a code was made from (useful for audits and debugging)
+    def decode(self, short_code):
+        return self.permutation.inverse(decode_base62(short_code))
+
+    # Reserve count sequence values in one round trip (nextval is never rolled back,
+    # so values reserved in a failed transaction are simply skipped)
+    def _reserve(self, session, count):
+        return list(session.execute(
+            text(f"SELECT nextval('{self.sequence}') FROM generate_series(1, CAST(:count AS integer))"),
+            {"count": count}
+        ).scalars())
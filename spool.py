@@ -0,0 +1,288 @@
+import fcntl
+import glob
+import logging
+import os
+import struct
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exc
+from sqlalchemy.dialects.postgresql import insert
+
+from ingest import ClickBuffer
+from models import Click
+from stats import increment_monthly_stats
+
+log = logging.getLogger(__name__)
+
+# One click per fixed-size record: event id, link id, clicked_at in microseconds since the
+# epoch (UTC), whether a fingerprint is present, the fingerprint, then a CRC32 of the rest
+RECORD = struct.Struct("<16sqq?16s")
+RECORD_SIZE = RECORD.size + 4
+EPOCH = datetime(1970, 1, 1)
+NO_FINGERPRINT = bytes(16)
+
+
+def encode_record(event_id, link_id, clicked_at, fingerprint=None):
+    if clicked_at.tzinfo is not None:
+        clicked_at = clicked_at.astimezone(timezone.utc).replace(tzinfo=None)
+    micros = (clicked_at - EPOCH) // timedelta(microseconds=1)
+    body = RECORD.pack(event_id, link_id, micros, fingerprint is not None, fingerprint or NO_FINGERPRINT)
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+# (event_id, link_id, clicked_at, fingerprint) for every intact record. A torn record at
+# the end (the process died in the middle of a write) and everything after it is skipped.
+def decode_records(data, path=""):
+    events = []
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        body = data[offset:offset + RECORD.size]
+        (crc,) = struct.unpack_from("<I", data, offset + RECORD.size)
+        if zlib.crc32(body) != crc:
+            log.warning("Corrupt record at byte %d of %s, skipping the rest", offset, path)
+            return events
+        event_id, link_id, micros, has_fingerprint, fingerprint = RECORD.unpack(body)
+        clicked_at = EPOCH + timedelta(microseconds=micros)
+        events.append((event_id, link_id, clicked_at, fingerprint if has_fingerprint else None))
+    if len(data) % RECORD_SIZE:
+        log.warning("Truncated record at the end of %s", path)
+    return events
+
+
+class ClickSpool(ClickBuffer):
+    """Click buffer backed by append-only segment files on local disk.
+
+    add() appends the click to the active segment with one write(), so it
+    costs the same whether the database is fast, slow or down, and clicks
+    survive a crash of the process. Every flush seals the active segment
+    with a single fsync (so one fsync covers all the clicks of a flush
+    interval) and loads every sealed segment into clicks and monthly_stats,
+    in chunks of max_events clicks per transaction, then deletes it.
+
+    Each click carries a random event id and clicks has a unique index on
+    (event_id, clicked_at), so loading a segment again after a crash between
+    the commit and the delete does not count anything twice. The active
+    segment is flock()ed by its writer; any process may load the others,
+    including segments left behind by a process that died.
+    """
+
+    def __init__(self, directory, session_factory, on_flush=None, flush_interval=0.1, max_events=1000,
+                 segment_bytes=4 * 1024 * 1024):
+        super().__init__(session_factory, on_flush=on_flush, flush_interval=flush_interval,
+                         max_events=max_events)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._segment_fd = None
+        self._segment_pid = None
+        self._segment_path = None
+        self._segment_size = 0
+        self._detached = []  # (fd, path, size) of full segments waiting for the flusher to seal
+        self._counters["loaded_segments"] = 0
+        self._counters["rejected_clicks"] = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        with self._lock:
+            # A forked child shares the parent's segment file; it must write its own
+            if self._segment_fd is not None and self._segment_pid != os.getpid():
+                os.close(self._segment_fd)
+                self._segment_fd = None
+                self._segment_size = 0
+                for fd, _, _ in self._detached:
+                    os.close(fd)
+                self._detached = []
+        super().start()
+
+    # Append a click to the active segment; it reaches the database with the next flush
+    def add(self, link_id, clicked_at, fingerprint=None):
+        self.start()
+        record = encode_record(uuid.uuid4().bytes, link_id, clicked_at, fingerprint)
+        with self._lock:
+            try:
+                if self._segment_fd is None:
+                    self._open_segment()
+                os.write(self._segment_fd, record)
+            except OSError:
+                self._counters["dropped"] += 1
+                log.exception("Cannot spool click for link %s", link_id)
+                return False
+            self._segment_size += RECORD_SIZE
+            self._counters["buffered"] += 1
+            full = self._segment_size >= self.max_events * RECORD_SIZE
+            if self._segment_size >= self.segment_bytes:
+                # The next click starts a new segment; the flusher seals this one
+                self._detached.append(self._detach())
+                full = True
+        if full:
+            self._wakeup.set()
+        return True
+
+    # Seal the active segment and load every sealed one; returns the number of clicks written
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                segments, self._detached = self._detached, []
+                segment = self._detach()
+            if segment is not None:
+                segments.append(segment)
+            for segment in segments:
+                self._seal(*segment)
+
+            started = time.perf_counter()
+            written = 0
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.log"))):
+                try:
+                    loaded = self._load_segment(path)
+                except Exception:
+                    # Keep this and the later segments for the next attempt
+                    with self._lock:
+                        self._counters["failed_flushes"] += 1
+                    log.exception("Failed to load click segment %s", path)
+                    break
+                if loaded is not None:
+                    written += loaded
+
+            if written:
+                with self._lock:
+                    self._counters["flushed"] += written
+                    self._counters["flushes"] += 1
+                    self._last_flush_ms = (time.perf_counter() - started) * 1000
+        return written
+
+    def stats(self):
+        stats = super().stats()
+        spooled = 0
+        for path in glob.glob(os.path.join(self.directory, "*.log")):
+            try:
+                spooled += os.path.getsize(path)
+            except OSError:
+                pass  # loaded and deleted meanwhile
+        stats["pending"] = spooled // RECORD_SIZE
+        stats["spooled_bytes"] = spooled
+        return stats
+
+    # Load one sealed segment and delete it; None when another writer or loader holds it
+    def _load_segment(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if os.fstat(fd).st_nlink == 0:
+                return None  # loaded by someone else while we waited for it
+            with os.fdopen(os.dup(fd), "rb") as f:
+                events = decode_records(f.read(), path)
+
+            written = 0
+            rejected = []
+            for start in range(0, len(events), self.max_events):
+                chunk = events[start:start + self.max_events]
+                try:
+                    rows = self._write(chunk)
+                except exc.IntegrityError:
+                    # Some clicks can never be loaded (e.g. unknown link); find them one by one
+                    rows = []
+                    for event in chunk:
+                        try:
+                            rows.extend(self._write([event]))
+                        except exc.IntegrityError:
+                            rejected.append(event)
+                written += len(rows)
+                if self.on_flush and rows:
+                    self.on_flush(rows)
+            if rejected:
+                self._reject(path, rejected)
+            os.unlink(path)
+            with self._lock:
+                self._counters["loaded_segments"] += 1
+            return written
+        finally:
+            os.close(fd)
+
+    # Set the clicks the database refused aside in path.rejected for inspection, instead of
+    # retrying them forever. Written whole, so loading the segment again rewrites the same file.
+    def _reject(self, path, events):
+        with open(path + ".rejected", "wb") as f:
+            f.write(b"".join(encode_record(*event) for event in events))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._counters["rejected_clicks"] += len(events)
+        log.error("Rejected %d clicks of segment %s, kept in %s.rejected", len(events), path, path)
+
+    # Insert the clicks that are not in the database yet and count them in monthly_stats;
+    # returns their (id, link_id, clicked_at, fingerprint) rows
+    def _write(self, events):
+        session = self.session_factory()
+        try:
+            stmt = (
+                insert(Click)
+                .on_conflict_do_nothing(index_elements=[Click.event_id, Click.clicked_at])
+                .returning(Click.id, Click.link_id, Click.clicked_at, Click.event_id)
+            )
+            rows = session.execute(stmt, [
+                {"event_id": event_id, "link_id": link_id, "clicked_at": clicked_at}
+                for event_id, link_id, clicked_at, _ in events
+            ]).all()
+
+            increment_monthly_stats(
+                session,
+                ((row.link_id, row.clicked_at.strftime('%Y-%m'), 1, 0, 0.0) for row in rows)
+            )
+
+            session.commit()
+            fingerprints = {event_id: fingerprint for event_id, _, _, fingerprint in events}
+            return [(row.id, row.link_id, row.clicked_at, fingerprints[row.event_id]) for row in rows]
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    # Segments are named by creation time so they load in order. The file is locked before
+    # it gets its final name, so no loader can take it while it is being written.
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}.log")
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(path + ".tmp", path)
+        self._segment_fd = fd
+        self._segment_pid = os.getpid()
+        self._segment_size = 0
+        self._segment_path = path
+
+    # Take the active segment away from add() as (fd, path, size), or None; called under the
+    # lock, so the next click opens a new segment while this one is sealed outside of it
+    def _detach(self):
+        if self._segment_fd is None:
+            return None
+        segment = (self._segment_fd, self._segment_path, self._segment_size)
+        self._segment_fd = None
+        self._segment_size = 0
+        return segment
+
+    # Make a detached segment durable and release it to the loaders. Only flush() calls it,
+    # without the lock, so redirects never wait for the disk.
+    def _seal(self, fd, path, size):
+        try:
+            if size:
+                os.fsync(fd)
+                self._fsync_directory()
+            else:
+                os.unlink(path)
+        finally:
+            os.close(fd)
+
+    # New segment names only survive an OS crash once the directory itself is synced
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
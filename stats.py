@@ -0,0 +1,283 @@
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import Float, Integer, String, column, func, select, tuple_, values
+from sqlalchemy.dialects.postgresql import insert
+
+from models import Link, MonthlyStat, SellerMonthlyStat
+
+
+# Add counter deltas to monthly_stats with a single INSERT ... ON CONFLICT DO UPDATE.
+# deltas is an iterable of (link_id, year_month, clicks, valid_clicks, rewards_earned);
+# the increments happen server-side, so concurrent writers never lose an update.
+def increment_monthly_stats(session, deltas):
+    merged = defaultdict(lambda: [0, 0, 0.0])
+    for link_id, year_month, clicks, valid_clicks, rewards_earned in deltas:
+        totals = merged[(link_id, year_month)]
+        totals[0] += clicks
+        totals[1] += valid_clicks
+        totals[2] += rewards_earned
+    if not merged:
+        return
+
+    # Sorted so concurrent statements lock rows in the same order and cannot deadlock
+    rows = [
+        {
+            "link_id": link_id,
+            "year_month": year_month,
+            "clicks": clicks,
+            "valid_clicks": valid_clicks,
+            "rewards_earned": rewards_earned,
+        }
+        for (link_id, year_month), (clicks, valid_clicks, rewards_earned) in sorted(merged.items())
+    ]
+    stmt = insert(MonthlyStat).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MonthlyStat.link_id, MonthlyStat.year_month],
+        set_={
+            "clicks": MonthlyStat.clicks + stmt.excluded.clicks,
+            "valid_clicks": MonthlyStat.valid_clicks + stmt.excluded.valid_clicks,
+            "rewards_earned": MonthlyStat.rewards_earned + stmt.excluded.rewards_earned,
+        },
+    )
+    session.execute(stmt)
+    increment_seller_stats(session, rows)
+
+
+# Add the same deltas to the sellers' rollup in seller_monthly_stats, in the caller's
+# transaction so both tables always agree. The links' sellers are looked up and the
+# deltas summed per seller and month by the database in the same statement.
+def increment_seller_stats(session, rows):
+    deltas = values(
+        column("link_id", Integer),
+        column("year_month", String),
+        column("clicks", Integer),
+        column("valid_clicks", Integer),
+        column("rewards_earned", Float),
+        name="deltas",
+    ).data([
+        (row["link_id"], row["year_month"], row["clicks"], row["valid_clicks"], row["rewards_earned"])
+        for row in rows
+    ])
+    # Ordered, like the monthly_stats rows, so concurrent statements lock in the same order
+    totals = (
+        select(Link.seller_id, deltas.c.year_month, func.sum(deltas.c.clicks),
+               func.sum(deltas.c.valid_clicks), func.sum(deltas.c.rewards_earned))
+        .join_from(deltas, Link, Link.id == deltas.c.link_id)
+        .group_by(Link.seller_id, deltas.c.year_month)
+        .order_by(Link.seller_id, deltas.c.year_month)
+    )
+    stmt = insert(SellerMonthlyStat).from_select(
+        ["seller_id", "year_month", "clicks", "valid_clicks", "rewards_earned"], totals
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SellerMonthlyStat.seller_id, SellerMonthlyStat.year_month],
+        set_={
+            "clicks": SellerMonthlyStat.clicks + stmt.excluded.clicks,
+            "valid_clicks": SellerMonthlyStat.valid_clicks + stmt.excluded.valid_clicks,
+            "rewards_earned": SellerMonthlyStat.rewards_earned + stmt.excluded.rewards_earned,
+        },
+    )
+    session.execute(stmt)
+
+
+# Convert YYYY-MM to MM/YYYY
+def format_month(year_month):
+    year, month = year_month.split('-')
+    return f"{month}/{year}"
+
+
+# Build the /stats entry for one link from its (year_month, clicks, rewards_earned) rows
+def link_stats_entry(url, monthly_stats):
+    return {
+        "url": url,
+        "total_clicks": sum(clicks for _, clicks, _ in monthly_stats),
+        "total_earnings": sum(rewards for _, _, rewards in monthly_stats),
+        "monthly_breakdown": [
+            {"month": format_month(year_month), "earnings": rewards}
+            for year_month, _, rewards in monthly_stats
+        ],
+    }
+
+
+# Group rows of link columns followed by (year_month, clicks, rewards_earned), ordered by
+# link id first, into (link columns, monthly stats) per link. Links without any monthly
+# stats come with a single row of NULL stats from the outer join.
+def group_monthly_stats(rows):
+    for _, link_rows in groupby(rows, key=lambda row: row[0]):
+        link_rows = list(link_rows)
+        monthly_stats = [tuple(row[-3:]) for row in link_rows if row[-3] is not None]
+        yield tuple(link_rows[0][:-3]), monthly_stats
+
+
+# Select the given page of links joined with their monthly stats, in page order
+def link_stats_query(page):
+    return (
+        select(page.c.id, page.c.original_url, page.c.created_at, MonthlyStat.year_month,
+               MonthlyStat.clicks, MonthlyStat.rewards_earned)
+        .outerjoin(MonthlyStat, MonthlyStat.link_id == page.c.id)
+        .order_by(page.c.created_at.desc(), page.c.id.desc(), MonthlyStat.year_month)
+    )
+
+
+# One page of /stats, newest links first, fetched with a single query.
+# Pass offset for numbered pages, or after=(created_at, id) of the last link already seen
+# to continue from there at the cost of the first page (served by ix_links_created_at_id).
+# Returns the entries and the (created_at, id) to continue from, or None on the last page.
+def stats_page(session, limit, offset=0, after=None):
+    page = select(Link.id, Link.original_url, Link.created_at)
+    if after is not None:
+        page = page.where(tuple_(Link.created_at, Link.id) < tuple_(*after))
+    page = (
+        page.order_by(Link.created_at.desc(), Link.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .subquery()
+    )
+
+    entries = []
+    next_key = None
+    for (link_id, url, created_at), monthly_stats in group_monthly_stats(session.execute(link_stats_query(page))):
+        entries.append(link_stats_entry(url, monthly_stats))
+        next_key = (created_at, link_id)
+    if len(entries) < limit:
+        next_key = None
+    return entries, next_key
+
+
+# /sellers/<seller_id>/stats: lifetime totals and monthly breakdown from the seller's rollup,
+# plus one page of the seller's links (newest first) with their own totals. Every query is
+# bounded by the page size or the number of months, not by how many links the seller has,
+# except the link count, an index-only scan of ix_links_seller_created_at_id.
+# Returns None for an unknown seller, else the entry and the key to continue from as in stats_page.
+def seller_stats(session, seller_id, limit, offset=0, after=None):
+    monthly = session.execute(
+        select(SellerMonthlyStat.year_month, SellerMonthlyStat.clicks,
+               SellerMonthlyStat.valid_clicks, SellerMonthlyStat.rewards_earned)
+        .where(SellerMonthlyStat.seller_id == seller_id)
+        .order_by(SellerMonthlyStat.year_month)
+    ).all()
+    total_links = session.execute(
+        select(func.count()).select_from(Link).where(Link.seller_id == seller_id)
+    ).scalar()
+    if not total_links and not monthly:
+        return None, None
+
+    page = select(Link.id, Link.short_code, Link.original_url, Link.created_at).where(Link.seller_id == seller_id)
+    if after is not None:
+        page = page.where(tuple_(Link.created_at, Link.id) < tuple_(*after))
+    page = (
+        page.order_by(Link.created_at.desc(), Link.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .subquery()
+    )
+    links = session.execute(
+        select(page.c.id, page.c.short_code, page.c.original_url, page.c.created_at,
+               func.coalesce(func.sum(MonthlyStat.clicks), 0),
+               func.coalesce(func.sum(MonthlyStat.rewards_earned), 0.0))
+        .outerjoin(MonthlyStat, MonthlyStat.link_id == page.c.id)
+        .group_by(page.c.id, page.c.short_code, page.c.original_url, page.c.created_at)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+    ).all()
+
+    entry = {
+        "seller_id": seller_id,
+        "total_links": total_links,
+        "total_clicks": sum(clicks for _, clicks, _, _ in monthly),
+        "total_valid_clicks": sum(valid_clicks for _, _, valid_clicks, _ in monthly),
+        "total_earnings": sum(rewards for _, _, _, rewards in monthly),
+        "monthly_breakdown": [
+            {"month": format_month(year_month), "clicks": clicks, "valid_clicks": valid_clicks,
+             "earnings": rewards}
+            for year_month, clicks, valid_clicks, rewards in monthly
+        ],
+        "links": [
+            {"short_code": short_code, "url": url, "total_clicks": clicks, "total_earnings": rewards}
+            for _, short_code, url, _, clicks, rewards in links
+        ],
+    }
+    next_key = (links[-1].created_at, links[-1].id) if links and len(links) == limit else None
+    return entry, next_key
+
+
+# /stats/top entries for the (short_code, clicks per minute, error) of HeavyHitters.top, in
+# that order; codes whose link is gone are left out
+def top_links(session, top):
+    if not top:
+        return []
+    rows = session.execute(
+        select(Link.short_code, Link.original_url, Link.seller_id)
+        .where(Link.short_code.in_([short_code for short_code, _, _ in top]))
+    ).all()
+    links = {row.short_code: row for row in rows}
+    return [
+        {"short_code": short_code, "url": links[short_code].original_url,
+         "seller_id": links[short_code].seller_id,
+         "clicks_per_minute": round(rate, 3), "error": round(error, 3)}
+        for short_code, rate, error in top if short_code in links
+    ]
+
+
+# The links with the most clicks in monthly_stats from since_month ('YYYY-MM') on, most clicked
+# first, as (short_code, id, original_url) rows; used to prewarm the link cache
+def most_clicked_links(session, limit, since_month):
+    return session.execute(
+        select(Link.short_code, Link.id, Link.original_url)
+        .join(MonthlyStat, MonthlyStat.link_id == Link.id)
+        .where(MonthlyStat.year_month >= since_month)
+        .group_by(Link.id)
+        .order_by(func.sum(MonthlyStat.clicks).desc(), Link.id)
+        .limit(limit)
+    ).all()
+
+
+# Opaque pagination cursor for a (created_at, id) key
+def encode_cursor(key):
+    created_at, link_id = key
+    raw = json.dumps([created_at.isoformat(), link_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Inverse of encode_cursor; raises ValueError for anything it did not produce
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, link_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(link_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+# Stream every link with its totals and monthly breakdown, one dict per link in id order.
+# Rows come from a server-side cursor in batches of batch_size, so memory use does not
+# depend on the number of links; the join is served by the links primary key and the
+# (link_id, year_month) unique index without sorting.
+def export_query(batch_size=1000):
+    return (
+        select(Link.id, Link.short_code, Link.seller_id, Link.original_url,
+               MonthlyStat.year_month, MonthlyStat.clicks, MonthlyStat.rewards_earned)
+        .outerjoin(MonthlyStat, MonthlyStat.link_id == Link.id)
+        .order_by(Link.id, MonthlyStat.year_month)
+        .execution_options(yield_per=batch_size)
+    )
+
+
+# One export line from the link columns and monthly stats of group_monthly_stats
+def export_entry(link, monthly_stats):
+    link_id, short_code, seller_id, url = link
+    entry = {"link_id": link_id, "short_code": short_code, "seller_id": seller_id}
+    entry.update(link_stats_entry(url, monthly_stats))
+    return entry
+
+
+def export_link_stats(session, batch_size=1000):
+    rows = session.execute(export_query(batch_size))
+    try:
+        for link, monthly_stats in group_monthly_stats(rows):
+            yield export_entry(link, monthly_stats)
+    finally:
+        rows.close()
@@ -0,0 +1,108 @@
+from cache import LinkCache, CachedLink, ResponseCache, VerdictCache
+
+
+def test_lru_eviction():
+    """Test the least recently used entry is evicted first"""
+    cache = LinkCache(max_size=2)
+    cache.put('a', CachedLink(1, 'https://fiverr.com/a'))
+    cache.put('b', CachedLink(2, 'https://fiverr.com/b'))
+    cache.get_or_load('a', lambda: None)  # touch 'a'
+    cache.put('c', CachedLink(3, 'https://fiverr.com/c'))
+
+    assert cache.get_or_load('a', lambda: None).id == 1
+    assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] >= 1
+
+def test_ttl_and_negative_ttl(clock):
+    """Test entries expire, unknown codes expire sooner"""
+    cache = LinkCache(ttl=60, negative_ttl=5, clock=clock)
+    loads = []
+
+    def loader(value):
+        def load():
+            loads.append(value)
+            return value
+        return load
+
+    link = CachedLink(1, 'https://fiverr.com')
+    assert cache.get_or_load('known', loader(link)) == link
+    assert cache.get_or_load('unknown', loader(None)) is None
+    assert len(loads) == 2
+
+    clock.now = 10
+    assert cache.get_or_load('known', loader(link)) == link
+    assert cache.get_or_load('unknown', loader(None)) is None
+    assert len(loads) == 3  # only the negative entry expired
+
+    clock.now = 61
+    cache.get_or_load('known', loader(link))
+    assert len(loads) == 4
+    stats = cache.stats()
+    assert stats['expirations'] == 2
+    assert stats['hits'] == 1
+
+def test_invalidate():
+    """Test invalidation forces a reload"""
+    cache = LinkCache()
+    cache.put('a', None)
+    cache.invalidate('a')
+    assert cache.get_or_load('a', lambda: CachedLink(1, 'https://fiverr.com')).id == 1
+    assert cache.stats()['invalidations'] == 1
+
+def test_pinned_codes_survive_eviction_and_expiry(clock):
+    """Test pinned codes stay cached under a scan of the long tail and go back to the LRU when unpinned"""
+    cache = LinkCache(max_size=2, ttl=60, clock=clock)
+    hot = CachedLink(1, 'https://fiverr.com/hot')
+    cache.put('hot', hot)
+    cache.pin(['hot', 'later'])
+    for i in range(10):
+        cache.put(f'tail-{i}', CachedLink(i + 2, 'https://fiverr.com/tail'))
+    cache.put('later', CachedLink(99, 'https://fiverr.com/later'))  # pinned once loaded
+
+    clock.now = 1000
+    assert cache.lookup('hot') == (True, hot)
+    assert cache.lookup('later')[1].id == 99
+    stats = cache.stats()
+    assert (stats['pinned'], stats['pinned_hits'], stats['size']) == (2, 2, 2)
+
+    cache.pin(['later'])
+    assert cache.lookup('hot') == (True, hot)
+    clock.now = 1061
+    assert cache.lookup('hot') == (False, None)
+    assert cache.lookup('later')[0]
+
+def test_verdict_cache_keeps_rejections_and_only_lru_counters(clock):
+    """Test a False verdict is a hit like any other and the stats carry no link cache series"""
+    cache = VerdictCache(window=60, clock=clock)
+    cache.put(('visitor', 1), False)
+    assert cache.lookup(('visitor', 1)) == (True, False)
+    clock.now = 61
+    assert cache.lookup(('visitor', 1)) == (False, None)
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['hit_rate']) == (1, 1, 1, 0.5)
+    assert not {'pinned', 'pinned_hits', 'negative_hits'} & set(stats)
+
+def test_response_cache_versions_and_max_age(clock):
+    """Test a bump hides older entries, values stored under a stale version never show, and entries expire"""
+    cache = ResponseCache(max_age=5, clock=clock)
+
+    version, value = cache.get('page-1')
+    assert value is None
+    cache.store(version, 'page-1', 'v1')
+    assert cache.get('page-1') == (version, 'v1')
+
+    # A write while the page was being computed: stored under the old version, never served
+    version, _ = cache.get('page-2')
+    cache.bump()
+    cache.store(version, 'page-2', 'stale')
+    assert cache.get('page-2')[1] is None
+    assert cache.get('page-1')[1] is None
+
+    version, _ = cache.get('page-1')
+    cache.store(version, 'page-1', 'v2')
+    clock.now = 4
+    assert cache.get('page-1')[1] == 'v2'
+    clock.now = 6
+    assert cache.get('page-1')[1] is None
+    assert not {'pinned', 'pinned_hits', 'negative_hits'} & set(cache.stats())
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+from fraud import ClickRateScorer, rate_rules
+from validation import PendingClick
+
+
+def click(fingerprint, link_id):
+    return PendingClick(None, link_id, None, fingerprint)
+
+
+def test_rate_features_for_a_batch(clock):
+    """Test per-visitor, per-link and per-pair rates are computed for the whole batch"""
+    scorer = ClickRateScorer(window=60, clock=clock)
+    batch = [click(b'a', 1), click(b'a', 1), click(b'a', 2), click(b'b', 1), click(None, 1)]
+    features = scorer.features(batch)
+
+    assert list(features['visitor_rate']) == [3, 3, 3, 1, 0]
+    assert list(features['link_rate']) == [4, 4, 1, 4, 4]
+    assert list(features['visitor_link_rate']) == [2, 2, 1, 1, 0]
+
+def test_rate_window_slides(clock):
+    """Test clicks older than the window stop counting"""
+    scorer = ClickRateScorer(window=30, clock=clock)
+    scorer.features([click(b'a', 1)] * 3)
+
+    clock.now = 10
+    # 4 clicks in the last 30 seconds is 8 per minute
+    assert list(scorer.features([click(b'a', 1)])['visitor_rate']) == [8]
+
+    clock.now = 31
+    assert list(scorer.features([click(b'a', 1)])['visitor_rate']) == [4]
+
+def test_rate_window_is_bounded(clock):
+    """Test at most max_tracked clicks are remembered"""
+    scorer = ClickRateScorer(window=60, max_tracked=10, clock=clock)
+    scorer.features([click(b'a', i) for i in range(25)])
+    assert list(scorer.features([click(b'a', 0)])['visitor_rate']) == [10]
+
+def test_rate_rules_reject_fast_visitors(clock):
+    """Test clicks above either rate limit are rejected"""
+    scorer = ClickRateScorer(window=60, clock=clock)
+    batch = [click(b'bot', 1)] * 5 + [click(b'human', 1), click(b'spread', 2), click(b'spread', 3)]
+    allowed = rate_rules(scorer.features(batch), max_visitor_rate=4, max_visitor_link_rate=2)
+    assert allowed == [False] * 5 + [True, True, True]
+
+def test_rates_follow_click_time_not_scoring_time(clock):
+    """Test a backlog scored late is measured as the clicks happened, and a burst scored in
+    two batches far apart still counts as one burst"""
+    scorer = ClickRateScorer(window=60, clock=clock)
+    start = datetime(2026, 1, 1, 12, 0)
+    clock.now = (start + timedelta(hours=2)).replace(tzinfo=timezone.utc).timestamp()
+
+    # One click every 10 seconds, validated two hours later in one batch
+    backlog = [PendingClick(None, 1, start + timedelta(seconds=10 * i), b'human') for i in range(20)]
+    features = scorer.features(backlog)
+    assert max(features['visitor_rate']) == 6
+    assert all(rate_rules(features, max_visitor_rate=10, max_visitor_link_rate=10))
+
+    # Ten clicks within ten seconds, the second half scored much later
+    burst = [PendingClick(None, 2, start + timedelta(hours=1, seconds=i), b'bot') for i in range(10)]
+    scorer.features(burst[:5])
+    clock.now += 3600
+    assert list(scorer.features(burst[5:])['visitor_rate']) == [6, 7, 8, 9, 10]
@@ -0,0 +1,67 @@
+import pytest
+import random
+from hotlinks import HeavyHitters
+
+
+def test_top_keys_of_a_skewed_stream(clock):
+    """Test the heavy keys are found with a handful of counters under a long tail"""
+    tracker = HeavyHitters(capacity=20, half_life=1e9, clock=clock)
+    rng = random.Random(7)
+    for i in range(20000):
+        if i % 2 == 0:
+            tracker.add('hot-a')
+        elif i % 5 == 1:
+            tracker.add('hot-b')
+        else:
+            tracker.add(f'tail-{rng.randrange(100000)}')
+
+    top = tracker.top(2)
+    assert [key for key, _, _ in top] == ['hot-a', 'hot-b']
+    assert tracker.stats() == {'tracked': 20, 'capacity': 20}
+    # Estimates only overcount, by at most their error
+    rate_a, error_a = top[0][1], top[0][2]
+    assert rate_a >= 10000 * 60 * tracker._decay
+    assert rate_a - error_a <= 10000 * 60 * tracker._decay * 1.0001
+
+def test_rates_decay_with_half_life(clock):
+    """Test a key's rate tracks its recent clicks and fades once they stop"""
+    tracker = HeavyHitters(capacity=10, half_life=10, clock=clock)
+    # 2 clicks a second for long enough to reach the steady state
+    for i in range(2000):
+        clock.now = i / 2
+        tracker.add('steady')
+    [(key, rate, error)] = tracker.top(1)
+    assert rate == pytest.approx(120, rel=0.05)
+    assert error == 0
+
+    clock.now += 10
+    assert tracker.top(1)[0][1] == pytest.approx(60, rel=0.05)
+
+    # A newer burst overtakes the old favourite
+    for _ in range(1000):
+        tracker.add('burst')
+    assert [key for key, _, _ in tracker.top(2)] == ['burst', 'steady']
+
+def test_counters_are_rescaled_without_changing_rates(clock):
+    """Test long uptimes rescale the forward-decayed counters instead of overflowing"""
+    tracker = HeavyHitters(capacity=10, half_life=1, clock=clock)
+    for i in range(79):
+        clock.now = i * 0.5
+        tracker.add('a')
+    before = tracker.top(1)[0][1]
+    clock.now = 40  # exp(decay * 40) is past RESCALE_AT
+    tracker.add('a')
+    assert tracker._start == 40
+    assert max(tracker._counts.values()) < 10
+    assert tracker.top(1)[0][1] == pytest.approx(before * 0.5 ** 1.0 + tracker._decay * 60)
+
+def test_refresh_callback(clock):
+    """Test on_refresh runs once per interval"""
+    refreshed = []
+    tracker = HeavyHitters(on_refresh=lambda t: refreshed.append(t.top(1)), refresh_interval=5, clock=clock)
+    tracker.add('a')
+    assert refreshed == []
+    clock.now = 5
+    tracker.add('a')
+    tracker.add('a')
+    assert [[key for key, _, _ in top] for top in refreshed] == [['a']]
@@ -0,0 +1,21 @@
+import sys
+from app import validation_pipeline
+
+# Validate clicks left pending in the database (e.g. after a restart or a full backlog)
+def validate_pending(batch_size=1000):
+    total = 0
+    while True:
+        before = validation_pipeline.stats()['validated']
+        queued = validation_pipeline.recover_pending(limit=batch_size)
+        validation_pipeline.drain()
+        total += queued
+        print(f"Validated {queued} pending clicks")
+        # Stop when the backlog is empty or the remaining clicks keep failing
+        if queued < batch_size or validation_pipeline.stats()['validated'] == before:
+            break
+
+    stats = validation_pipeline.stats()
+    print(f"Done: {total} clicks processed, {stats['valid']} valid, {stats['failed']} failed")
+
+if __name__ == "__main__":
+    validate_pending(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
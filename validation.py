@@ -0,0 +1,282 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import tuple_, update
+
+from models import Click
+from stats import increment_monthly_stats
+
+log = logging.getLogger(__name__)
+
+# Credit awarded for each click that passes fraud validation (USD)
+REWARD_PER_CLICK = 0.05
+
+# A recorded click that is waiting for its fraud verdict; fingerprint identifies the
+# visitor (see app.visitor_fingerprint) and is None when unknown
+PendingClick = namedtuple("PendingClick", ["click_id", "link_id", "clicked_at", "fingerprint"],
+                          defaults=(None,))
+
+
+class ValidationPipeline:
+    """Runs fraud validation for recorded clicks on background worker threads.
+
+    Redirects submit a PendingClick and return immediately. A worker takes up
+    to batch_size queued clicks at a time, calls validator(batch) for their
+    verdicts (a list of booleans in batch order), stores the verdicts on the
+    Clicks and credits the MonthlyStat rows in one transaction. The queue is
+    bounded: when it is full the click stays pending in the database and can
+    be picked up by recover_pending().
+
+    With a verdict_cache, a click from a visitor who clicked the same link
+    within the cache window is not validated again: it reuses the earlier
+    verdict, or with repeat_policy="duplicate" it is rejected as a duplicate.
+
+    screen(batch), when given, sees every click of a batch once, repeats
+    included, before any verdict is reused or the validator runs, and returns
+    a boolean per click; clicks it returns False for are rejected outright
+    (e.g. rate rules, which must count the repeats to see a bot at all).
+    """
+
+    def __init__(self, session_factory, validator, workers=4, max_queue=10000,
+                 max_retries=3, retry_delay=0.5, on_validate=None, verdict_cache=None,
+                 repeat_policy="reuse", batch_size=100, on_apply=None, screen=None):
+        if repeat_policy not in ("reuse", "duplicate"):
+            raise ValueError(f"Unknown repeat policy: {repeat_policy}")
+        self.session_factory = session_factory
+        self.validator = validator
+        # Called with (seconds, verdicts) after each validator call; verdicts is None when it raised
+        self.on_validate = on_validate
+        # Called with the number of clicks whose verdict was stored, after the transaction commits
+        self.on_apply = on_apply
+        self.verdict_cache = verdict_cache
+        self.screen = screen
+        self.repeat_policy = repeat_policy
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "validated": 0,
+            "valid": 0,
+            "retried": 0,
+            "failed": 0,
+            "repeats": 0,  # clicks answered from the verdict cache
+            "screened_out": 0,  # clicks rejected by screen() without validation
+        }
+        # Clicks sent to the validator and its total duration, to estimate the time repeats saved
+        self._validator_clicks = 0
+        self._validator_seconds = 0.0
+
+    # Start the worker threads (again after a fork, threads do not survive it)
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"click-validator-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # Queue a click for validation; returns False when the backlog is full
+    def submit(self, pending):
+        self.start()
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            self._count("rejected")
+            log.warning("Validation backlog full, click %s left pending", pending.click_id)
+            return False
+        self._count("submitted")
+        return True
+
+    # Block until every queued click has been processed (or the timeout expires)
+    def drain(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    # Drain the backlog and stop the workers
+    def stop(self, timeout=None):
+        drained = self.drain(timeout)
+        with self._lock:
+            # Workers still busy after the timeout are daemons and die with the process
+            if drained and self._pid == os.getpid():
+                for _ in self._threads:
+                    self._queue.put(None)
+                for thread in self._threads:
+                    thread.join(timeout)
+            self._threads = []
+            self._pid = None
+        return drained
+
+    # Snapshot of the backlog and the lifetime counters
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            mean_seconds = self._validator_seconds / self._validator_clicks if self._validator_clicks else 0.0
+        counters["validation_seconds_saved"] = round(counters["repeats"] * mean_seconds, 3)
+        if self.verdict_cache is not None:
+            counters["verdict_cache_hit_rate"] = self.verdict_cache.stats()["hit_rate"]
+        backlog = self._queue.qsize()
+        counters.update({
+            "backlog": backlog,
+            "in_flight": max(self._queue.unfinished_tasks - backlog, 0),
+            "capacity": self._queue.maxsize,
+            "workers": len(self._threads),
+        })
+        return counters
+
+    # Re-queue clicks still pending in the database (left by a restart or a full backlog)
+    def recover_pending(self, limit=1000):
+        session = self.session_factory()
+        try:
+            rows = (
+                session.query(Click.id, Click.link_id, Click.clicked_at)
+                .filter(Click.is_valid.is_(None))
+                .order_by(Click.id)
+                .limit(limit)
+                .all()
+            )
+        finally:
+            session.close()
+
+        queued = 0
+        for click_id, link_id, clicked_at in rows:
+            if not self.submit(PendingClick(click_id, link_id, clicked_at)):
+                break
+            queued += 1
+        return queued
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Add whatever else is already queued, up to a full batch
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            try:
+                if not stop or len(batch) > 1:
+                    self._process([pending for pending in batch if pending is not None])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _process(self, batch):
+        # Once per batch, not per attempt, so retries do not count the clicks again
+        allowed = self._screen(batch)
+        verdicts = [self._repeat_verdict(pending) if ok else False for pending, ok in zip(batch, allowed)]
+        for attempt in range(self.max_retries + 1):
+            try:
+                unknown = [i for i, verdict in enumerate(verdicts) if verdict is None]
+                if unknown:
+                    fresh = self._validate([batch[i] for i in unknown])
+                    for i, verdict in zip(unknown, fresh):
+                        verdicts[i] = verdict
+                        pending = batch[i]
+                        if self.verdict_cache is not None and pending.fingerprint is not None:
+                            self.verdict_cache.put((pending.fingerprint, pending.link_id), verdict)
+                self._apply(batch, verdicts)
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    self._count("failed", len(batch))
+                    log.exception("Giving up on validating %d clicks", len(batch))
+                    return
+                self._count("retried", len(batch))
+                log.warning("Validation of %d clicks failed, retrying", len(batch), exc_info=True)
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    def _screen(self, batch):
+        if self.screen is None:
+            return [True] * len(batch)
+        try:
+            allowed = list(self.screen(batch))
+        except Exception:
+            log.exception("Screening %d clicks failed, validating them all", len(batch))
+            return [True] * len(batch)
+        self._count("screened_out", allowed.count(False))
+        return allowed
+
+    # Verdict for a visitor's repeat click on the same link, or None to validate it
+    def _repeat_verdict(self, pending):
+        if self.verdict_cache is None or pending.fingerprint is None:
+            return None
+        found, verdict = self.verdict_cache.lookup((pending.fingerprint, pending.link_id))
+        if not found:
+            return None
+        self._count("repeats")
+        return verdict if self.repeat_policy == "reuse" else False
+
+    def _validate(self, batch):
+        started = time.perf_counter()
+        verdicts = None
+        try:
+            verdicts = [bool(verdict) for verdict in self.validator(batch)]
+            if len(verdicts) != len(batch):
+                raise ValueError(f"Validator returned {len(verdicts)} verdicts for {len(batch)} clicks")
+            return verdicts
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self._validator_clicks += len(batch)
+                self._validator_seconds += seconds
+            if self.on_validate is not None:
+                self.on_validate(seconds, verdicts)
+
+    # Store the verdicts and credit the sellers, skipping clicks that were already validated
+    def _apply(self, batch, verdicts):
+        session = self.session_factory()
+        try:
+            updated = []
+            for verdict in (True, False):
+                # (id, clicked_at) pairs also limit the update to the clicks' monthly partitions
+                keys = [(p.click_id, p.clicked_at) for p, v in zip(batch, verdicts) if v is verdict]
+                if keys:
+                    updated.extend((verdict, row) for row in session.execute(
+                        update(Click)
+                        .where(tuple_(Click.id, Click.clicked_at).in_(keys), Click.is_valid.is_(None))
+                        .values(is_valid=verdict, rewarded=verdict)
+                        .returning(Click.link_id, Click.clicked_at)
+                    ))
+            increment_monthly_stats(session, [
+                (link_id, clicked_at.strftime("%Y-%m"), 0, 1, REWARD_PER_CLICK)
+                for verdict, (link_id, clicked_at) in updated if verdict
+            ])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        valid = sum(1 for verdict, _ in updated if verdict)
+        self._count("validated", len(updated))
+        self._count("valid", valid)
+        if self.on_apply is not None and updated:
+            self.on_apply(len(updated))